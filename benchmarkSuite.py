@@ -0,0 +1,387 @@
+''' Benchmark Suite - command counts and modelled cost of ribbon and limb builds, checked against stored baselines '''
+
+import dataclasses
+import itertools
+import json
+import math
+import os
+import sys
+import time
+
+import mayaStandIn
+
+
+# Stored results the suite is checked against, next to this file
+baselinePath = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarkBaselines.json")
+
+# Rough relative cost of each command in Maya, commands not listed cost the default
+commandCosts = {"createNode": 1.0, "joint": 1.0, "group": 1.0, "spaceLocator": 1.5, "nurbsPlane": 3.0, "duplicate": 3.0,
+                "nonLinear": 5.0, "blendShape": 5.0, "skinCluster": 10.0, "ikHandle": 5.0, "parentConstraint": 2.0,
+                "pointConstraint": 2.0, "orientConstraint": 2.0, "aimConstraint": 2.0, "poleVectorConstraint": 2.0,
+                "parent": 1.0, "matchTransform": 1.0, "makeIdentity": 1.0, "setDrivenKeyframe": 2.0, "ls": 0.5,
+                "listRelatives": 0.5, "objExists": 0.25, "setAttr": 0.25, "getAttr": 0.25, "connectAttr": 0.5,
+                "addAttr": 0.5, "rename": 0.5, "select": 0.1, "xform": 0.5, "rigBuilderCommit": 1.0,
+                # Modifier operations are only queued, the work is done by the one doIt
+                "MDagModifier.createNode": 0.5, "MDagModifier.renameNode": 0.1, "MDagModifier.reparentNode": 0.1,
+                "MDagModifier.newPlugValue": 0.05, "MDagModifier.connect": 0.1, "MDagModifier.disconnect": 0.1,
+                "MDagModifier.addAttribute": 0.1, "MDagModifier.doIt": 1.0}
+defaultCost = 0.5
+
+# Numbers of unrelated nodes the scaling benchmark fills the scene with before each build
+scalingSizes = (1000, 10000, 100000, 500000)
+
+# Log-log slopes of time against scene size, above which a command grows with the scene or grows super-linearly
+sceneDependentSlope = 0.5
+superLinearSlope = 1.3
+
+# Time below this is too small to compare between scene sizes
+minimumTime = 0.001
+
+
+def modelledCost(counts):
+    ''' Adds up the cost of a build from the number of calls of each command '''
+    return round(sum(commandCosts.get(command, defaultCost) * count for command, count in counts.items()), 2)
+
+
+def ribbonScenarios():
+    '''
+    Every direction, joint axis and joint snap combination, as values for the ribbon tool UI.
+    Then each setting the UI does not have, given as options replacing the UI's settings, a batch, a rebuild from the registry
+    and pre-flight checks of ribbons that cannot be built
+    '''
+    for direction, jointAxis, snap in itertools.product(["Horizontal", "Vertical"], ["X", "Y", "Z"], [False, True]):
+        name = f"ribbon_{direction}_{jointAxis}_{'snap' if snap else 'free'}"
+        ui = {"nameMenu": "ribbon", "lengthMenu": 2.5, "directionMenu": direction, "axisMenu": "Z", "jointAxisMenu": jointAxis,
+              "scaleMenu": 1.0, "snapCheck": snap}
+        yield name, ui
+    ui = {"nameMenu": "ribbon", "lengthMenu": 2.5, "directionMenu": "Horizontal", "axisMenu": "Z", "jointAxisMenu": "X",
+          "scaleMenu": 1.0, "snapCheck": False}
+    options = {"backend_modifier": {"backend": "modifier"}, "attach_uvPin": {"attach": "uvPin"},
+               "deformStack_surface": {"deformStack": "surface"}, "skinWeights_linear": {"skinWeights": "linear"},
+               "skinWeights_smooth": {"skinWeights": "smooth"}, "ctrl3_bind5": {"ctrlCount": 3, "bindCount": 5},
+               "ctrl7_bind17": {"ctrlCount": 7, "bindCount": 17}}
+    for name, settings in options.items():
+        yield "ribbon_" + name, dict(ui, options=settings)
+    yield "ribbon_batch", dict(ui, batch=["ribbonA", "ribbonB"])
+    yield "ribbon_rebuild", dict(ui, rebuild={})
+    # Settings the pre-flight has to report on rather than fail on
+    yield "ribbon_preflight_maxInfluences", dict(ui, preflight=True, options={"skinWeights": "linear", "maxInfluences": 0})
+    yield "ribbon_preflight_snapRootNotJoint", dict(ui, preflight=True, options={"jointSnap": True, "snapRoot": "ribbon_guide"})
+
+
+def limbScenarios():
+    '''
+    Arms and legs with every stretch and roll combination, as values for the limb tool UI.
+    Then each rigLimb option the UI does not have, the modifier backend, a longer chain, batches, a rebuild from the registry
+    and pre-flight checks of limbs that cannot be built
+    '''
+    for limb, stretch, roll in itertools.product(["Arm", "Leg"], [False, True], [False, True]):
+        name = f"limb_{limb}_{'stretch' if stretch else 'rigid'}_{'roll' if roll else 'noRoll'}"
+        ui = {"legMenu": limb, "rollCheck": roll, "stretchCheck": stretch, "jointCountField": 3}
+        yield name, ui
+    # Both arms selected are rigged as a batch, sharing the systems group of the roll joints
+    yield "limb_Arm_batch_roll", {"legMenu": "Arm", "rollCheck": True, "stretchCheck": False, "jointCountField": 3, "sides": ["L", "R"]}
+    ui = {"legMenu": "Arm", "rollCheck": False, "stretchCheck": False, "jointCountField": 3}
+    yield "limb_Arm_stretchSwitch", dict(ui, stretchCheck=True, options={"stretchSwitch": 1})
+    yield "limb_Arm_constantLength", dict(ui, stretchCheck=True, options={"constantLength": 1, "globalScale": "master_ctrl.scaleX"})
+    yield "limb_Arm_matrixBlend", dict(ui, options={"matrixBlend": 1})
+    yield "limb_Arm_twistRoll", dict(ui, rollCheck=True, options={"twistRoll": 1})
+    yield "limb_Arm_backend_modifier", dict(ui, stretchCheck=True, rollCheck=True, backend="modifier")
+    yield "limb_Leg_joints4", dict(ui, legMenu="Leg", jointCountField=4)
+    yield "limb_Arm_batch_stretchSwitch", dict(ui, stretchCheck=True, sides=["L", "R"], options={"stretchSwitch": 1})
+    yield "limb_Arm_rebuild", dict(ui, stretchCheck=True, rollCheck=True, rebuild={})
+    # Roots the pre-flight has to report on rather than fail on
+    yield "limb_preflight_noSide", dict(ui, root="pelvis", preflight=True)
+
+
+def snapChain(cmds):
+    ''' Makes a joint chain for ribbons to snap to and selects its root '''
+    cmds.select(cl=1)
+    for c in range(5):
+        cmds.joint(n=f"snap_{c:02}_jnt")
+        cmds.setAttr(f"snap_{c:02}_jnt.translate", c, 0, 0)
+    cmds.select("snap_00_jnt")
+
+
+def limbSkeleton(cmds, isArm, sides=("L",), jointCount=3):
+    '''
+    Makes a skeleton and the controls limbs are rigged onto, as a character would have them, and selects the limb roots.
+    Limbs longer than 3 joints get extra joints after the middle one. Returns the limb roots
+    '''
+    limbType = "arm" if isArm else "leg"
+    names = ["shoulder", "elbow", "wrist"] if isArm else ["hip", "knee", "ankle"]
+    names = names[:2] + [f"{names[1]}{c:02}" for c in range(1, jointCount - 2)] + names[2:]
+    cmds.select(cl=1)
+    cmds.joint(n="root_jnt")
+    cmds.joint(n="chest_jnt")
+    cmds.createNode("transform", n="master_ctrl")
+    cmds.setAttr("master_ctrl.scaleX", 1)
+    roots = []
+    for side in sides:
+        chain = [f"{x}_{side}_jnt" for x in names]
+        roots.append(chain[0])
+        if isArm:
+            cmds.select("chest_jnt")
+            cmds.joint(n=f"clavicle_{side}_jnt")
+        else:
+            cmds.select("root_jnt")
+        for c, joint in enumerate(chain):
+            cmds.joint(n=joint)
+            cmds.setAttr(joint + ".translate", 0, -c * 3.0, 0)
+        cmds.select(cl=1)
+
+        # Controls the tool expects to find
+        for joint in chain:
+            cmds.createNode("transform", n=joint.replace("_jnt", "_FK_ctrl"))
+        endIkControl = cmds.createNode("transform", n=chain[-1].replace("_jnt", "_IK_ctrl"))
+        cmds.createNode("transform", n=chain[(len(chain) - 1) // 2].replace("_jnt", "_pole_ctrl"))
+        mainControl = cmds.createNode("transform", n=f"{limbType}_{side}_IK_FK_switch_ctrl")
+        cmds.createNode("reverse", n=f"{limbType}_{side}_IK_FK_reverse")
+        cmds.addAttr(mainControl, ln=f"{limbType}_{side}_IK_FK_switch_CTRL", at="float")
+        cmds.addAttr(mainControl, ln="Volume_Offset", at="float")
+        cmds.addAttr(endIkControl, ln="Stretchiness", at="float")
+        cmds.addAttr(endIkControl, ln="StretchType", at="enum")
+    cmds.select(roots)
+    return roots
+
+
+def decoyScene(scene, count):
+    '''
+    Fills the scene with unrelated nodes, as a heavy shot would have, straight into the scene without recording.
+    Names that glob lookups could match are among them: curves, hair systems and other rigs' follicles
+    '''
+    decoys = (("curve", "nurbsCurve"), ("hairSystem", "hairSystem"), ("shot_follicle_", "follicle"),
+              ("geo_", "mesh"), ("prop_grp_", "transform"))
+    for i in range(count):
+        prefix, shapeType = decoys[i % len(decoys)]
+        name = f"{prefix}{i}"
+        scene.nodes[name] = {"type": "transform", "parent": None, "attrs": {}}
+        scene.addUuid(name)
+        # Every other decoy has a shape under it, so half the decoys are DAG hierarchies
+        if i % 2:
+            shape = name + "Shape"
+            scene.nodes[shape] = {"type": shapeType, "parent": name, "attrs": {}}
+            scene.addUuid(shape)
+            scene.childNodes[name] = [shape]
+
+
+def ribbonSettings(maker, ui):
+    ''' Returns the settings of the ribbon the UI describes, with any options replacing them '''
+    return dataclasses.replace(maker.settingsFromUI(), **ui.get("options", {}))
+
+
+def buildRibbons(ribbonTool, ui):
+    ''' Builds the ribbon the UI describes, with any options replacing its settings, or one ribbon for each name of a batch '''
+    maker = ribbonTool.ribbonMaker()
+    settings = ribbonSettings(maker, ui)
+    if "batch" in ui:
+        maker.buildBatch([dataclasses.replace(settings, name=x) for x in ui["batch"]])
+    else:
+        maker.build(settings)
+
+
+def buildLimbs(limbTool, ui, roots):
+    ''' Rigs the selected limbs through the limb tool UI, or with rigLimb when there are options the UI does not have '''
+    if "options" not in ui:
+        limbTool.autoLimbTool()
+        return
+    isArm = ui["legMenu"] == "Arm"
+    args = (ui["jointCountField"], ui["rollCheck"], ui["stretchCheck"])
+    if len(roots) > 1:
+        limbTool.rigLimbBatch([(x, isArm) for x in roots], *args, **ui["options"])
+    else:
+        limbTool.rigLimb(roots[0], isArm, *args, **ui["options"])
+
+
+def checkPreflight(report):
+    ''' Pre-flight scenarios are set up so the build cannot go ahead, a valid report means a problem went unreported '''
+    if report["valid"]:
+        raise RuntimeError("The pre-flight check found nothing wrong with a build it should have stopped")
+
+
+def prepareScenario(cmds, tools, kind, ui, sceneSize=0):
+    '''
+    Starts a stand-in scene holding sceneSize unrelated nodes with what the scenario is built onto, and returns the function building it.
+    A rebuild scenario is built here first, the function rebuilds it from its registry. A pre-flight scenario only runs the check
+    '''
+    ribbonTool, limbTool, skeletonIndex = tools
+    cmds.reset()
+    # Cached skeletons and plans belong to the last scene
+    skeletonIndex.removeCallbacks()
+    ribbonTool.planCache.clear()
+    decoyScene(cmds.scene, sceneSize)
+    cmds.scene.ui.update(ui)
+    if kind == "ribbon":
+        if ui["snapCheck"]:
+            snapChain(cmds)
+        if ui.get("options", {}).get("snapRoot"):
+            # A transform rather than a joint, for the pre-flight to report
+            cmds.createNode("transform", n=ui["options"]["snapRoot"])
+        build = lambda: buildRibbons(ribbonTool, ui)
+        rebuild = lambda: ribbonTool.rebuild(ui["nameMenu"], **ui["rebuild"])
+        preflight = lambda: ribbonTool.preflight(ribbonSettings(ribbonTool.ribbonMaker(), ui))
+    else:
+        isArm = ui["legMenu"] == "Arm"
+        roots = limbSkeleton(cmds, isArm, ui.get("sides", ("L",)), ui["jointCountField"])
+        if "root" in ui:
+            # A joint of its own under the root joint, rigged in place of the skeleton's limbs
+            cmds.select("root_jnt")
+            roots = [cmds.joint(n=ui["root"])]
+            cmds.select(roots)
+        # The limb networks are made with cmds unless the scenario is for the modifier backend
+        limbTool.networkBackend = ui.get("backend", "cmds")
+        build = lambda: buildLimbs(limbTool, ui, roots)
+        rebuild = lambda: limbTool.rebuildLimb(limbTool.limbRigName(roots[0], isArm), **ui["rebuild"])
+        preflight = lambda: limbTool.limbPreflight(roots[0], isArm, ui["jointCountField"], ui["rollCheck"], ui["stretchCheck"],
+                                                   **ui.get("options", {}))
+    if ui.get("preflight"):
+        return lambda: checkPreflight(preflight())
+    if "rebuild" not in ui:
+        return build
+    build()
+    return rebuild
+
+
+def runScenario(cmds, tools, kind, ui):
+    ''' Builds one scenario in a fresh stand-in scene and returns its command counts and modelled cost '''
+    build = prepareScenario(cmds, tools, kind, ui)
+    cmds.calls = []
+    build()
+    counts = cmds.counts()
+    return {"commands": len(cmds.calls), "cost": modelledCost(counts), "calls": counts}
+
+
+def runSuite():
+    ''' Runs every scenario outside Maya with the stand-in and returns the results by scenario '''
+    cmds = mayaStandIn.install()
+    import ribbonTool, limbTool, skeletonIndex
+    tools = (ribbonTool, limbTool, skeletonIndex)
+    results = {}
+    for name, ui in ribbonScenarios():
+        results[name] = runScenario(cmds, tools, "ribbon", ui)
+    for name, ui in limbScenarios():
+        results[name] = runScenario(cmds, tools, "limb", ui)
+    return results
+
+
+def scalingScenarios():
+    ''' The heaviest ribbon and limb builds, which touch the most commands '''
+    ribbon = dict(ribbonScenarios())
+    limb = dict(limbScenarios())
+    yield "ribbon_Horizontal_X_snap", "ribbon", ribbon["ribbon_Horizontal_X_snap"]
+    yield "limb_Arm_stretch_roll", "limb", limb["limb_Arm_stretch_roll"]
+
+
+def timeScenario(cmds, tools, kind, ui, sceneSize):
+    ''' Builds one scenario in a stand-in scene holding sceneSize unrelated nodes, returning its build time and time in each command '''
+    build = prepareScenario(cmds, tools, kind, ui, sceneSize)
+    cmds.calls = []
+    start = time.perf_counter()
+    build()
+    buildTime = time.perf_counter() - start
+    commandTimes = {}
+    for commandName, args, kwargs, duration in cmds.calls:
+        commandTimes[commandName] = commandTimes.get(commandName, 0) + duration
+    return {"time": buildTime, "commands": commandTimes}
+
+
+def growthSlope(sizes, times):
+    ''' Returns the log-log slope of time against scene size between the first and last size, 1 being linear '''
+    if times[0] <= 0 or times[-1] < minimumTime:
+        return 0.0
+    return math.log(times[-1] / times[0]) / math.log(sizes[-1] / sizes[0])
+
+
+def runScaling(sizes=scalingSizes, repeats=3):
+    '''
+    Times the scaling scenarios in scenes of each size, keeping the fastest of the repeats.
+    Returns the build time against scene size of each scenario and the commands whose time grows with the scene
+    '''
+    cmds = mayaStandIn.install()
+    import ribbonTool, limbTool, skeletonIndex
+    tools = (ribbonTool, limbTool, skeletonIndex)
+    results = {}
+    for name, kind, ui in scalingScenarios():
+        runs = []
+        for size in sizes:
+            runs.append(min((timeScenario(cmds, tools, kind, ui, size) for x in range(repeats)), key=lambda x: x["time"]))
+        times = [x["time"] for x in runs]
+        # The slope between each pair of neighbouring sizes shows where the curve bends
+        steps = [growthSlope(sizes[i:i + 2], times[i:i + 2]) for i in range(len(sizes) - 1)]
+        commands = {}
+        for command in set(x for run in runs for x in run["commands"]):
+            commandTimes = [run["commands"].get(command, 0) for run in runs]
+            # Commands take too little time in small scenes to compare, so they are compared in the two largest
+            slope = growthSlope(sizes[-2:], commandTimes[-2:])
+            if slope > sceneDependentSlope:
+                commands[command] = {"times": commandTimes, "slope": slope, "superLinear": slope > superLinearSlope}
+        results[name] = {"sizes": list(sizes), "times": times, "steps": steps,
+                         "superLinear": max(steps) > superLinearSlope, "commands": commands}
+    # Decoys are not kept around after the benchmark
+    cmds.reset()
+    return results
+
+
+def scalingMessages(results):
+    ''' Returns a message for every scenario or command whose time grows super-linearly with the scene '''
+    messages = []
+    for name, result in results.items():
+        if result["superLinear"]:
+            messages.append(f"{name}: build time grows super-linearly, slopes {[round(x, 2) for x in result['steps']]}")
+        for command, growth in sorted(result["commands"].items()):
+            if growth["superLinear"]:
+                messages.append(f"{name}: {command} time grows super-linearly, slope {round(growth['slope'], 2)}")
+    return messages
+
+
+def checkBaselines(results, baselines, tolerance=0.01):
+    ''' Returns a message for every scenario whose command count or modelled cost has gone up past its baseline '''
+    failures = []
+    for name, result in results.items():
+        if name not in baselines:
+            failures.append(f"{name}: no baseline stored")
+            continue
+        baseline = baselines[name]
+        if result["commands"] > baseline["commands"]:
+            failures.append(f"{name}: {result['commands']} commands, baseline {baseline['commands']}")
+        if result["cost"] > baseline["cost"] * (1 + tolerance):
+            failures.append(f"{name}: modelled cost {result['cost']}, baseline {baseline['cost']}")
+    return failures
+
+
+def main(args):
+    '''
+    Runs the suite and checks it against the baselines, or stores new baselines with --update.
+    With --scaling, times builds against scene size instead and fails on super-linear growth
+    '''
+    if "--scaling" in args:
+        results = runScaling()
+        for name, result in results.items():
+            print(name)
+            for size, buildTime in zip(result["sizes"], result["times"]):
+                print(f"    {size:8} nodes {buildTime * 1000:10.2f} ms")
+            for command, growth in sorted(result["commands"].items()):
+                print(f"    {command} grows with the scene, slope {round(growth['slope'], 2)}")
+        messages = scalingMessages(results)
+        for message in messages:
+            print("SUPER-LINEAR " + message)
+        return 1 if messages else 0
+        
+    results = runSuite()
+    for name, result in results.items():
+        print(f"{name:40} {result['commands']:6} commands  {result['cost']:8} cost")
+    if "--update" in args:
+        with open(baselinePath, "w") as baselineFile:
+            json.dump({name: {"commands": x["commands"], "cost": x["cost"]} for name, x in results.items()}, baselineFile, indent=4, sort_keys=True)
+            baselineFile.write("\n")
+        print("Baselines updated")
+        return 0
+    with open(baselinePath) as baselineFile:
+        failures = checkBaselines(results, json.load(baselineFile))
+    for failure in failures:
+        print("REGRESSION " + failure)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,7 +1,411 @@
 # Auto limb tool
 
+import math
+import sys
+import time
+
 import maya.cmds as cmds
 
+import rigBuilder
+import skeletonIndex
+
+
+# Builder backend the node networks are made with, the modifier makes each network in one undoable commit
+networkBackend = "modifier"
+
+
+#---------------------------------------------------------------------
+# Describes the stretch and volume network of a limb as nodes and connections
+
+def stretchNetwork(limbName, limbChain, stretchEndPosLoc, mainControl, stretchSwitch=0, restLength=None, globalScale=None):
+    
+    # Node and joint names are built once up front
+    lengthNode = limbName + "_length"
+    stretchDistNode = limbName + "_stretchDistNode"
+    scaleFactor = limbName + "_scaleFactor"
+    condition = limbName + "_condition"
+    blendColors = limbName + "_blendColors"
+    volume = limbName + "_volume"
+    stretchJoints = [x.replace("_jnt", "_stretch_jnt") for x in limbChain]
+    ikJoints = [x.replace("_jnt", "_IK_jnt") for x in limbChain]
+    endIkControl = limbChain[-1].replace("_jnt", "_IK_ctrl")
+    
+    nodes = []
+    connections = []
+    
+    # A rest length worked out at build time replaces the live distance chain
+    # It is scaled by the global scale if there is one, otherwise it is set straight on the scale factor
+    if restLength is not None:
+        if globalScale:
+            scaleNode, scaleAttr = globalScale.split(".", 1)
+            nodes.append(("multDoubleLinear", lengthNode, {"input1": restLength}))
+            connections += [(scaleNode, scaleAttr, lengthNode, "input2"),
+                            (lengthNode, "output", scaleFactor, "input2X")]
+    
+    else:
+        # Add all the distance nodes together using a plusMinusAverage node
+        nodes.append(("plusMinusAverage", lengthNode, {}))
+        connections.append((lengthNode, "output1D", scaleFactor, "input2X"))
+        
+        # Build distance nodes for each section, ignoring the last joint or it will try to include the fingers / toes
+        for i in range(len(limbChain) - 1):
+            distNode = limbChain[i].replace("_jnt", "_distNode")
+            nodes.append(("distanceBetween", distNode, {}))
+            connections += [(stretchJoints[i], "worldMatrix[0]", distNode, "inMatrix1"),
+                            (stretchJoints[i+1], "worldMatrix[0]", distNode, "inMatrix2"),
+                            (stretchJoints[i], "rotatePivotTranslate", distNode, "point1"),
+                            (stretchJoints[i+1], "rotatePivotTranslate", distNode, "point2"),
+                            (distNode, "distance", lengthNode, "input1D[" + str(i) + "]")]
+    
+    # Distance between the root and stretch end locator to check if stretching
+    # Scale factor compares the length of the limb with the length to the stretch locator
+    # Conditional node passes this onto the joints, to control how the limb stretches
+    # Blend colors adds the ability to blend between the stretchiness, volume works out the squash with a power
+    scaleFactorValues = {"operation": 2}
+    if restLength is not None and not globalScale:
+        scaleFactorValues["input2X"] = restLength
+        
+    nodes += [("distanceBetween", stretchDistNode, {}),
+              ("multiplyDivide", scaleFactor, scaleFactorValues),
+              ("condition", condition, {"operation": 2, "secondTerm": 1}),
+              ("blendColors", blendColors, {"color2": (1, 0, 0)}),
+              ("multiplyDivide", volume, {"operation": 3})]
+    
+    connections += [(stretchJoints[0], "worldMatrix[0]", stretchDistNode, "inMatrix1"),
+                    (stretchEndPosLoc, "worldMatrix[0]", stretchDistNode, "inMatrix2"),
+                    (stretchJoints[0], "rotatePivotTranslate", stretchDistNode, "point1"),
+                    (stretchEndPosLoc, "rotatePivotTranslate", stretchDistNode, "point2"),
+                    (stretchDistNode, "distance", scaleFactor, "input1X"),
+                    (scaleFactor, "outputX", condition, "firstTerm"),
+                    (scaleFactor, "outputX", blendColors, "color1R"),
+                    (blendColors, "outputR", condition, "colorIfTrueR"),
+                    (endIkControl, "Stretchiness", blendColors, "blender"),
+                    (blendColors, "outputR", volume, "input1X"),
+                    (mainControl, "Volume_Offset", volume, "input2X"),
+                    (volume, "outputX", condition, "colorIfTrueG")]
+    
+    # Stretch drives the IK joints, volume scales the main joints below the root
+    connections += [(condition, "outColorR", x, "scaleY") for x in ikJoints]
+    for joint in limbChain[1:]:
+        connections += [(condition, "outColorG", joint, "scaleX"), (condition, "outColorG", joint, "scaleZ")]
+        
+    # Optionally pick the condition operation from StretchType with condition nodes instead of driven keys
+    if stretchSwitch:
+        nodes, connections = stretchTypeSwitch(limbName, endIkControl, condition, nodes, connections)
+    
+    return nodes, connections
+
+
+
+#---------------------------------------------------------------------
+# Describes a matrix network that blends each main joint between its IK joint and FK control
+
+def matrixBlendNetwork(limbChain, ikJoints, fkControls, parents, mainControl, switchAttr, stretchCheck=0):
+    
+    nodes = []
+    connections = []
+    
+    for i in range(len(limbChain)):
+        blendNode = limbChain[i].replace("_jnt", "_IK_FK_blendMatrix")
+        localNode = limbChain[i].replace("_jnt", "_IK_FK_multMatrix")
+        
+        # The switch blends from the IK joint (0) to the FK control (1), as the constraint weights did
+        nodes.append(("blendMatrix", blendNode, {}))
+        connections += [(ikJoints[i], "worldMatrix[0]", blendNode, "inputMatrix"),
+                        (fkControls[i], "worldMatrix[0]", blendNode, "target[0].targetMatrix"),
+                        (mainControl, switchAttr, blendNode, "target[0].weight")]
+        blendOutput = (blendNode, "outputMatrix")
+        
+        # Stretch scales the IK joints, the constraints never passed scale on so it is dropped here too
+        if stretchCheck:
+            pickNode = limbChain[i].replace("_jnt", "_IK_FK_pickMatrix")
+            nodes.append(("pickMatrix", pickNode, {"useScale": 0, "useShear": 0}))
+            connections.append(blendOutput + (pickNode, "inputMatrix"))
+            blendOutput = (pickNode, "outputMatrix")
+        
+        # Bring the blended world matrix into the space of the joint's parent
+        nodes.append(("multMatrix", localNode, {}))
+        connections += [blendOutput + (localNode, "matrixIn[0]"),
+                        (localNode, "matrixSum", limbChain[i], "offsetParentMatrix")]
+        if parents[i]:
+            connections.append((parents[i], "worldInverseMatrix[0]", localNode, "matrixIn[1]"))
+    
+    return nodes, connections
+
+
+
+#---------------------------------------------------------------------
+# Builds roll joints driven by the twist of the limb joints, extracted from their matrices
+
+def twistRollSystem(limbChain, twistPlan, matrices):
+    
+    # The twist nodes come from the matrix and quaternion plugins that ship with Maya
+    for plugin in ["matrixNodes", "quatNodes"]:
+        if not cmds.pluginInfo(plugin, q=1, loaded=1):
+            cmds.loadPlugin(plugin, quiet=1)
+            
+    rootParent = cmds.listRelatives(limbChain[0], p=1)
+    rootParent = rootParent[0] if rootParent else None
+    
+    # The upper roll joint sits under the root joint and cancels out its twist
+    # The lower roll joint sits at the end joint, under the joint above it, and takes on the end joint's twist
+    # (driving joint, roll joint parent, rest transform parent, cancel the twist?)
+    rollList = [(limbChain[0], limbChain[0], rootParent, 1),
+                (limbChain[-1], limbChain[-2], limbChain[-2], 0)]
+    
+    cmds.select(cl=1)
+    
+    for driver, rollParent, restParent, invert in rollList:
+        rollJointName = driver.replace("_jnt", "_roll_jnt")
+        restName = driver.replace("_jnt", "_twist_rest")
+        
+        cmds.joint(n=rollJointName, rad=0.6)
+        cmds.xform(rollJointName, ws=1, m=matrices[driver])
+        cmds.makeIdentity(rollJointName, a=1, t=0, r=1, s=0,)
+        cmds.parent( rollJointName, rollParent)
+        cmds.select(cl=1)
+        
+        # The rest transform keeps where the driving joint starts, so twist is measured from the bind pose
+        if restParent:
+            cmds.createNode("transform", n=restName, p=restParent, ss=1)
+        else:
+            cmds.createNode("transform", n=restName, ss=1)
+        cmds.xform(restName, ws=1, m=matrices[driver])
+        
+    # Both planned twist networks are made in one modifier commit
+    builder = rigBuilder.getBuilder(networkBackend)
+    rigBuilder.executePlan(builder, twistPlan)
+    builder.commit()
+
+
+
+#---------------------------------------------------------------------
+# Describes a network that extracts the twist of a joint around its Y axis and drives a roll joint with it
+
+def twistNetwork(driver, rest, rollJoint, invert=0):
+    
+    baseName = driver.replace("_jnt", "_twist")
+    localNode = baseName + "_multMatrix"
+    decompose = baseName + "_decomposeMatrix"
+    normalize = baseName + "_quatNormalize"
+    toEuler = baseName + "_quatToEuler"
+    
+    nodes = [("multMatrix", localNode, {}),
+             ("decomposeMatrix", decompose, {}),
+             ("quatNormalize", normalize, {}),
+             ("quatToEuler", toEuler, {})]
+    
+    # Rotation of the joint relative to its rest transform, as a quaternion
+    connections = [(driver, "worldMatrix[0]", localNode, "matrixIn[0]"),
+                   (rest, "worldInverseMatrix[0]", localNode, "matrixIn[1]"),
+                   (localNode, "matrixSum", decompose, "inputMatrix")]
+    
+    # Keeping only the Y and W parts and normalizing leaves the twist around the Y axis, without the bend
+    connections += [(decompose, "outputQuatY", normalize, "inputQuatY"),
+                    (decompose, "outputQuatW", normalize, "inputQuatW")]
+    twistOutput = (normalize, "outputQuat")
+    
+    # Inverting the twist cancels it out instead
+    if invert:
+        inverse = baseName + "_quatInvert"
+        nodes.append(("quatInvert", inverse, {}))
+        connections.append(twistOutput + (inverse, "inputQuat"))
+        twistOutput = (inverse, "outputQuat")
+        
+    connections += [twistOutput + (toEuler, "inputQuat"),
+                    (toEuler, "outputRotate", rollJoint, "rotate")]
+    
+    return nodes, connections
+
+
+
+#---------------------------------------------------------------------
+# Measures the length of a joint chain, from the world positions of all the joints in one query
+
+def chainLength(joints):
+    
+    positions = cmds.xform(joints, q=1, ws=1, t=1)
+    points = [positions[i:i+3] for i in range(0, len(positions), 3)]
+    
+    length = 0
+    for i in range(len(points) - 1):
+        length += math.sqrt(sum((points[i+1][axis] - points[i][axis]) ** 2 for axis in range(3)))
+        
+    return length
+
+
+
+#---------------------------------------------------------------------
+# Adds a network that sets the condition operation straight from the StretchType attribute
+
+def stretchTypeSwitch(limbName, endIkControl, condition, nodes, connections):
+    
+    # Condition operation for each StretchType
+    # Not equal (Squash and stretch), Greater or equal (Stretch only), Less or equal (Squash only)
+    operations = [1, 3, 5]
+    
+    # One condition per type checks for a match, falling through to the next condition if it doesn't match
+    selectors = [limbName + "_stretchType" + str(i) + "_condition" for i in range(len(operations) - 1)]
+    for i in range(len(selectors)):
+        values = {"secondTerm": i, "colorIfTrueR": operations[i]}
+        
+        # The last condition gives the final operation when nothing else matched
+        if i == len(selectors) - 1:
+            values["colorIfFalseR"] = operations[-1]
+        else:
+            connections.append((selectors[i+1], "outColorR", selectors[i], "colorIfFalseR"))
+        
+        nodes.append(("condition", selectors[i], values))
+        connections.append((endIkControl, "StretchType", selectors[i], "firstTerm"))
+        
+    connections.append((selectors[0], "outColorR", condition, "operation"))
+    
+    return nodes, connections
+
+
+
+#---------------------------------------------------------------------
+# Finds the joints of the limb, following the first child joint down from the root
+
+def findLimbChain(jointRoot, limbJoints):
+    
+    # The skeleton under the root is walked once and cached until the joints in the scene change
+    chain = skeletonIndex.getIndex(jointRoot).chain(jointRoot, limbJoints)
+            
+    if len(chain) < limbJoints:
+        cmds.error("The selected joint chain has fewer than " + str(limbJoints) + " joints")
+    
+    return chain
+
+
+
+#---------------------------------------------------------------------
+# Plans the node networks of a limb as plain data, without touching the scene
+# Each network is its own list of operations, applied with rigBuilder.executePlan once the nodes it reads from are made
+# The plan can be saved and compared between tool versions
+# The joint chains, IK and constraints are placed from the joints in the scene, so rigLimb still makes those as it goes
+
+def limbPlan(jointRoot, limbChain, isArm, stretchCheck=0, stretchSwitch=0, restLength=None, globalScale=None, matrixBlend=0, twistRoll=0, rootParent=None):
+    
+    # The same names rigLimb builds
+    # A root with no side still gets names, so a preflight can report the problem rather than fail
+    limbType = "arm" if isArm else "leg"
+    nameParts = jointRoot.split("_")
+    limbSide = nameParts[1] if len(nameParts) > 1 else ""
+    limbName = nameParts[0] + "_" + limbSide
+    mainControl = limbType + "_" + limbSide + "_IK_FK_switch_ctrl"
+    switchAttr = limbType + "_" + limbSide + "_IK_FK_switch_CTRL"
+    ikJoints = [x.replace("_jnt", "_IK_jnt") for x in limbChain]
+    fkControls = [x.replace("_jnt", "_FK_ctrl") for x in limbChain]
+    endIkControl = limbChain[-1].replace("_jnt", "_IK_ctrl")
+    
+    plan = {}
+    
+    if matrixBlend:
+        # The root joint's parent comes from the scene, so it is passed in
+        builder = rigBuilder.planBuilder()
+        parents = [rootParent] + limbChain[:-1]
+        rigBuilder.buildNetwork(builder, *matrixBlendNetwork(limbChain, ikJoints, fkControls, parents, mainControl, switchAttr, stretchCheck))
+        
+        # The offsetParentMatrix holds the whole local transform, so the joint's own transform is zeroed
+        for joint in limbChain:
+            builder.setAttr(joint, "translate", 0, 0, 0)
+            builder.setAttr(joint, "rotate", 0, 0, 0)
+            builder.setAttr(joint, "jointOrient", 0, 0, 0)
+        plan["matrixBlend"] = builder.plan
+        
+    if stretchCheck:
+        builder = rigBuilder.planBuilder()
+        stretchEndPosLoc = jointRoot.replace("_jnt", "_stretchEndPos_loc")
+        rigBuilder.buildNetwork(builder, *stretchNetwork(limbName, limbChain, stretchEndPosLoc, mainControl, stretchSwitch, restLength, globalScale))
+        
+        # With the switch network the stretch type only needs setting to its default, stretch only
+        if stretchSwitch:
+            builder.setAttr(endIkControl, "StretchType", 1)
+        plan["stretch"] = builder.plan
+        
+    if twistRoll:
+        builder = rigBuilder.planBuilder()
+        for driver, invert in [(limbChain[0], 1), (limbChain[-1], 0)]:
+            twistNodes = twistNetwork(driver, driver.replace("_jnt", "_twist_rest"), driver.replace("_jnt", "_roll_jnt"), invert)
+            rigBuilder.buildNetwork(builder, *twistNodes)
+        plan["twist"] = builder.plan
+            
+    return plan
+
+
+
+#---------------------------------------------------------------------
+# Checks a limb can be rigged before anything in the scene changes
+# Every node and attribute the limb needs and every name it will create is checked with one bulk query
+
+def limbPreflight(jointRoot, isArm, limbJoints=3, rollCheck=0, stretchCheck=0, systems=None, stretchSwitch=0, constantLength=0, globalScale=None, matrixBlend=0, twistRoll=0, **buildOptions):
+    
+    errors = []
+    if limbJoints < 3:
+        errors.append("A limb needs at least 3 joints")
+        
+    # The same names rigLimb builds
+    limbType = "arm" if isArm else "leg"
+    nameParts = jointRoot.split("_")
+    limbSide = nameParts[1] if len(nameParts) > 1 else ""
+    if not "L" in limbSide and not "R" in limbSide:
+        errors.append("Please select a joint with either L or R specified")
+    limbName = nameParts[0] + "_" + limbSide
+    mainControl = limbType + "_" + limbSide + "_IK_FK_switch_ctrl"
+    switchAttr = limbType + "_" + limbSide + "_IK_FK_switch_CTRL"
+    
+    # Everything else is named from the limb chain, so the root has to be there first
+    if not cmds.ls(jointRoot, type="joint"):
+        return rigBuilder.preflightReport([jointRoot], [], errors)
+    limbChain = skeletonIndex.getIndex(jointRoot).chain(jointRoot, limbJoints)
+    if len(limbChain) < limbJoints:
+        errors.append("The selected joint chain has fewer than " + str(limbJoints) + " joints")
+        
+    ikJoints = [x.replace("_jnt", "_IK_jnt") for x in limbChain]
+    fkControls = [x.replace("_jnt", "_FK_ctrl") for x in limbChain]
+    endIkControl = limbChain[-1].replace("_jnt", "_IK_ctrl")
+    poleControl = limbChain[(len(limbChain) - 1) // 2].replace("_jnt", "_pole_ctrl")
+    
+    # Nodes and attributes the rig is built onto
+    required = fkControls + [endIkControl, poleControl, mainControl, mainControl + "." + switchAttr]
+    if not matrixBlend:
+        required.append(limbType + "_" + limbSide + "_IK_FK_reverse")
+    required.append("clavicle_" + limbSide + "_jnt" if isArm else "root_jnt")
+    if stretchCheck:
+        required += [endIkControl + ".Stretchiness", endIkControl + ".StretchType", mainControl + ".Volume_Offset"]
+        if globalScale:
+            required.append(globalScale)
+    if rollCheck and not twistRoll:
+        required.append("chest_jnt" if isArm else "root_jnt")
+        if not systems:
+            required.append("master_ctrl")
+            
+    # Nodes the rig creates, the networks give their node names without building anything
+    newJointList = ["_IK_jnt", "_stretch_jnt"] if matrixBlend else ["_IK_jnt", "_FK_jnt", "_stretch_jnt"]
+    created = [x.replace("_jnt", newJoint) for newJoint in newJointList for x in limbChain]
+    created.append(limbType + "_" + limbSide + "_IK_handle")
+    created.append(limbType + "_" + limbSide + rigBuilder.registrySuffix)
+    if stretchCheck:
+        created.append(jointRoot.replace("_jnt", "_stretchEndPos_loc"))
+    if rollCheck and twistRoll:
+        for driver in [limbChain[0], limbChain[-1]]:
+            created += [driver.replace("_jnt", "_roll_jnt"), driver.replace("_jnt", "_twist_rest")]
+    elif rollCheck:
+        created += [limbChain[0].replace("_jnt", "_roll_jnt"), limbChain[-1].replace("_jnt", "_roll_jnt"),
+                    limbChain[0].replace("_jnt", "_follow_jnt"), limbChain[0].replace("_jnt", "_follow_tip_jnt"),
+                    limbChain[0].replace("_jnt", "_roll_aim_loc"), limbChain[-1].replace("_jnt", "_roll_aim_loc"),
+                    limbType + "_" + limbSide + "_follow_IK_handle"]
+            
+    # The networks give their node names from the same plan the build uses
+    restLength = 1.0 if constantLength else None
+    plan = limbPlan(jointRoot, limbChain, isArm, stretchCheck, stretchSwitch, restLength, globalScale, matrixBlend, rollCheck and twistRoll)
+    created += [x[2] for operations in plan.values() for x in operations if x[0] == "createNode"]
+    
+    return rigBuilder.preflightReport(required, created, errors)
+
+
+
 def autoLimbTool(*args):
     # Set up variables which could come from the UI
     
@@ -18,18 +422,8 @@ def autoLimbTool(*args):
     
     stretchCheck = cmds.checkBox("stretchCheck", q=1, v=1)    
     
-    
-    
     # How many joints are we working with
-    limbJoints = 3
-    
-    # Use this information to generate the names
-    if isArm:
-        limbType = "arm"
-        print("Working on the arm")
-    else:
-        limbType = "leg"
-        print("Working on the leg")
+    limbJoints = cmds.intField("jointCountField", q=1, v=1)
         
     # Check the selection is valid
     selectionCheck = cmds.ls(sl=1, type="joint")
@@ -37,17 +431,170 @@ def autoLimbTool(*args):
     # Error check to make sure a joint is selected
     if not selectionCheck:
         cmds.error("Please select the root joint")
+    
+    # Several selected roots are rigged together as a batch
+    if len(selectionCheck) > 1:
+        rigLimbBatch([(x, isArm) for x in selectionCheck], limbJoints, rollCheck, stretchCheck)
+    else:
+        rigLimb(selectionCheck[0], isArm, limbJoints, rollCheck, stretchCheck)
+
+
+
+#---------------------------------------------------------------------
+# Rigs several limbs in one pass, e.g. both arms and legs of a character
+
+def rigLimbBatch(limbs, limbJoints=3, rollCheck=0, stretchCheck=0, **options):
+    
+    # Limbs can be (jointRoot, isArm) pairs using the shared settings, or dictionaries of rigLimb arguments
+    # Any other rigLimb options given are shared by every limb
+    limbArgs = []
+    for limb in limbs:
+        args = {"limbJoints": limbJoints, "rollCheck": rollCheck, "stretchCheck": stretchCheck}
+        args.update(options)
+        if isinstance(limb, dict):
+            args.update(limb)
+        else:
+            args.update({"jointRoot": limb[0], "isArm": limb[1]})
+        limbArgs.append(args)
+        
+    # Every limb is checked before anything is built, including names two limbs would share
+    check = rigBuilder.mergeReports([limbPreflight(**args) for args in limbArgs])
+    if not check["valid"]:
+        cmds.error(rigBuilder.preflightMessage(check))
+    
+    # The whole batch is one undo chunk with the viewport refresh suspended
+    report = []
+    cmds.undoInfo(openChunk=True, chunkName="limbBatch")
+    cmds.refresh(suspend=True)
+    try:
+        
+        # The systems group and its master constraint are shared, so they are set up once
+        # Only the follow joints of the standard roll system go in it
+        systems = None
+        if any(x["rollCheck"] and not x.get("twistRoll") for x in limbArgs):
+            systems = systemsGroup()
+            
+        for args in limbArgs:
+            start = time.perf_counter()
+            timings = rigLimb(systems=systems, validate=0, **args)
+            report.append({"limb": args["jointRoot"], "time": time.perf_counter() - start, "stages": timings["stages"]})
+            
+    finally:
+        cmds.refresh(suspend=False)
+        cmds.undoInfo(closeChunk=True)
+        
+    return report
+
+
+
+#---------------------------------------------------------------------
+# Sets up the hidden systems group that holds the roll follow joints
+
+def systemsGroup():
+    
+    if not cmds.objExists("systems"):
+        cmds.group( em=True, n="systems" )  # Create the systems group
+        
+    cmds.parentConstraint( "master_ctrl", "systems",  w=1, mo=1 ) # Parent constraint systems as a child of master_ctrl
+    cmds.setAttr( "systems.visibility", 0)  # Make the systems group non visible
+    
+    return "systems"
+
+
+
+#---------------------------------------------------------------------
+# Rigs the limb starting at jointRoot, works without the UI
+# With timing on, the time and cmds calls of each stage are returned and added to timingLog as a JSON line
+# Every node the limb creates is listed in a registry node named after the limb, e.g. arm_L_registry
+
+def rigLimb(jointRoot, isArm, limbJoints=3, rollCheck=0, stretchCheck=0, systems=None, stretchSwitch=0, constantLength=0, globalScale=None, matrixBlend=0, twistRoll=0, validate=1, timing=0, timingCommands=0, timingLog=""):
+    
+    timer = rigBuilder.stageTimer((sys.modules[__name__], rigBuilder, skeletonIndex), timing, timingCommands)
+    recorder = rigBuilder.nodeRecorder()
+    try:
+        recorder.start()
+        try:
+            roles = buildLimb(timer, jointRoot, isArm, limbJoints, rollCheck, stretchCheck, systems, stretchSwitch, constantLength, globalScale, matrixBlend, twistRoll, validate)
+        finally:
+            # Reading back the recorded nodes is timed with the registry
+            timer.start("registry")
+            created = recorder.stop()
+        
+        # The settings are kept with the nodes so the limb can be rebuilt from its registry
+        settings = {"jointRoot": jointRoot, "isArm": isArm, "limbJoints": limbJoints, "rollCheck": rollCheck, "stretchCheck": stretchCheck,
+                    "stretchSwitch": stretchSwitch, "constantLength": constantLength, "globalScale": globalScale,
+                    "matrixBlend": matrixBlend, "twistRoll": twistRoll}
+        rigBuilder.writeRegistry(limbRigName(jointRoot, isArm), "limb", settings, created, roles)
+    finally:
+        timings = timer.finish(timingLog)
+        
+    return timings
+
+
+
+#---------------------------------------------------------------------
+# Finds, tears down and rebuilds limbs from their registry nodes, by limb name e.g. arm_L
+
+def limbRigName(jointRoot, isArm):
+    
+    return ("arm" if isArm else "leg") + "_" + jointRoot.split("_")[1]
+
+
+def limbRegistry(limbName):
+    
+    registry = rigBuilder.findRegistry(limbName)
+    if not registry or rigBuilder.registrySettings(registry)[0] != "limb":
+        cmds.error("No limb named " + limbName + " was found")
+    return registry
+
+
+def limbNodes(limbName):
+    
+    # Every node the limb created, by role
+    return rigBuilder.registryNodes(limbRegistry(limbName))
+
+
+def teardownLimb(limbName):
+    
+    # Deletes every node the limb created, apart from the shared systems group, and returns its rigLimb settings
+    return rigBuilder.teardownRig(limbRegistry(limbName))[1]
+
+
+def rebuildLimb(limbName, **changes):
+    
+    # Changes are checked before the teardown, so a bad setting leaves the limb in place
+    registry = limbRegistry(limbName)
+    settings = rigBuilder.registrySettings(registry)[1]
+    unknown = [x for x in changes if x not in settings and x not in ("timing", "timingCommands", "timingLog")]
+    if unknown:
+        cmds.error("Unknown limb settings: " + ", ".join(unknown))
+    settings.update(changes)
+    rigBuilder.teardownRig(registry)
+    return rigLimb(**settings)
+
+
+
+#---------------------------------------------------------------------
+# Builds each stage of the limb, marking the start of each stage on the timer
+
+def buildLimb(timer, jointRoot, isArm, limbJoints=3, rollCheck=0, stretchCheck=0, systems=None, stretchSwitch=0, constantLength=0, globalScale=None, matrixBlend=0, twistRoll=0, validate=1):
+    
+    # Check everything the limb needs first, a batch has already checked all its limbs
+    timer.start("preflight")
+    if validate:
+        check = limbPreflight(jointRoot, isArm, limbJoints, rollCheck, stretchCheck, systems, stretchSwitch, constantLength, globalScale, matrixBlend, twistRoll)
+        if not check["valid"]:
+            cmds.error(rigBuilder.preflightMessage(check))
+    
+    # Use this information to generate the names
+    if isArm:
+        limbType = "arm"
     else:
-        jointRoot = cmds.ls(sl=1, type="joint")[0]
+        limbType = "leg"
         
     # Check for indicator of which side the limb is
     limbSide = jointRoot.split("_")[1]
     
-    # Usable side check
-    if not "L" in limbSide:
-        if not "R" in limbSide:
-            cmds.error("Please select a joint with either L or R specified")
-    
     # Check for joint name
     jointName = jointRoot.split("_")[0]    
     
@@ -64,14 +611,24 @@ def autoLimbTool(*args):
     #---------------------------------------------------------------------
     # Build the list of joints we're working with
     
-    # Find the children
-    jointHeirarchy = cmds.listRelatives(jointRoot, ad=1, type="joint")
+    # The limb joints, from the root down to the end joint (wrist / ankle)
+    timer.start("findLimbChain")
+    limbChain = findLimbChain(jointRoot, limbJoints)
+    endJoint = limbChain[-1]
+    
+    # World matrices of the skeleton, read in one pass before anything is built
+    # New joints and locators are placed from these rather than querying each limb joint
+    matrices = skeletonIndex.getIndex(jointRoot).worldMatrices()
     
-    # Add selected joint to the list
-    jointHeirarchy.append(jointRoot)
+    # The pole vector control sits on the middle joint (elbow / knee)
+    poleJoint = limbChain[(limbJoints - 1) // 2]
     
-    # Reverse list
-    jointHeirarchy.reverse()
+    # Build every name the limb needs in one pass
+    ikJoints = [x.replace("_jnt", "_IK_jnt") for x in limbChain]
+    fkJoints = [x.replace("_jnt", "_FK_jnt") for x in limbChain]
+    fkControls = [x.replace("_jnt", "_FK_ctrl") for x in limbChain]
+    endIkControl = endJoint.replace("_jnt", "_IK_ctrl")
+    ikHandle = limbType + "_" + limbSide + "_IK_handle"
     
     # Clear selection
     cmds.select(cl=1)
@@ -81,57 +638,92 @@ def autoLimbTool(*args):
     #---------------------------------------------------------------------
     # Duplicate the main joint chain and rename the joints
     
-    # Define the joint chains
-    newJointList = ["_IK_jnt", "_FK_jnt", "_stretch_jnt"]
+    # Define the joint chains, the matrix blend reads the FK controls directly so it needs no FK joints
+    if matrixBlend:
+        newJointList = ["_IK_jnt", "_stretch_jnt"]
+    else:
+        newJointList = ["_IK_jnt", "_FK_jnt", "_stretch_jnt"]
     
     # Build the joints
+    timer.start("jointChains")
     for newJoint in newJointList:
-        for i in range(limbJoints):
-            newJointName = jointHeirarchy[i].replace("_jnt", newJoint)
+        for joint in limbChain:
+            newJointName = joint.replace("_jnt", newJoint)
             
             cmds.joint(n=newJointName, rad=0.5)
-            cmds.matchTransform(newJointName, jointHeirarchy[i])
+            cmds.xform(newJointName, ws=1, m=matrices[joint])
             cmds.makeIdentity(newJointName, a=1, t=0, r=1, s=0,)
             
         cmds.select(cl=1)
 
 
 
+    #---------------------------------------------------------------------
+    # Plan the node networks, each is applied once the nodes it reads from are made
+    timer.start("plan")
+    
+    # The main root's parent is the only one outside the limb chain
+    rootParent = None
+    if matrixBlend:
+        rootParent = cmds.listRelatives(limbChain[0], p=1)
+        rootParent = rootParent[0] if rootParent else None
+        
+    # The stretch joints the network measures never move, so their rest length can be measured once now instead of every frame
+    restLength = None
+    if stretchCheck and constantLength:
+        restLength = chainLength([x.replace("_jnt", "_stretch_jnt") for x in limbChain])
+        
+    plan = limbPlan(jointRoot, limbChain, isArm, stretchCheck, stretchSwitch, restLength, globalScale, matrixBlend, rollCheck and twistRoll, rootParent)
+
+
+
     #---------------------------------------------------------------------
     # Constrain main joint chain to IK and FK
-    for i in range(limbJoints):
-        cmds.parentConstraint( (jointHeirarchy[i].replace("_jnt", "_IK_jnt")), (jointHeirarchy[i].replace("_jnt", "_FK_jnt")), jointHeirarchy[i], w=1, mo=0 )
+    timer.start("constraints")
+    blendConstraints = []
+    if not matrixBlend:
+        for i in range(limbJoints):
+            blendConstraints.append(cmds.parentConstraint( ikJoints[i], fkJoints[i], limbChain[i], w=1, mo=0 )[0])
 
 
 
     #---------------------------------------------------------------------
     # Setup FK
     # Connect FK controls to joints
-    for i in range(limbJoints):
-        cmds.parentConstraint( (jointHeirarchy[i].replace("_jnt", "_FK_ctrl")), (jointHeirarchy[i].replace("_jnt", "_FK_jnt")), w=1, mo=0 )
+    if not matrixBlend:
+        for i in range(limbJoints):
+            cmds.parentConstraint( fkControls[i], fkJoints[i], w=1, mo=0 )
 
 
 
     #---------------------------------------------------------------------
     # Setup IK
     # Create IK handle between the root and end joint
-    cmds.ikHandle( n=(limbType + "_" + limbSide + "_IK_handle"), sol="ikRPsolver", sj=(jointHeirarchy[0].replace("_jnt", "_IK_jnt")), ee=(jointHeirarchy[2].replace("_jnt", "_IK_jnt")))
+    timer.start("ik")
+    cmds.ikHandle( n=ikHandle, sol="ikRPsolver", sj=ikJoints[0], ee=ikJoints[-1])
 
     # Adjust heirarchy so that IK controller drives the IK handle
-    cmds.parent( (limbType + "_" + limbSide + "_IK_handle"), (jointHeirarchy[2].replace("_jnt", "_IK_ctrl")) )
+    cmds.parent( ikHandle, endIkControl )
 
     # Made the IK control drive the joint to maintain orientation
-    cmds.orientConstraint( jointHeirarchy[2].replace("_jnt", "_IK_ctrl"), jointHeirarchy[2].replace("_jnt", "_IK_jnt"), w=1)
+    cmds.orientConstraint( endIkControl, ikJoints[-1], w=1)
 
     # Add pole vector to the IK joint
-    cmds.poleVectorConstraint( (jointHeirarchy[1].replace("_jnt", "_pole_ctrl")), (limbType + "_" + limbSide + "_IK_handle"), w=1 )
+    cmds.poleVectorConstraint( poleJoint.replace("_jnt", "_pole_ctrl"), ikHandle, w=1 )
 
 
 
     #---------------------------------------------------------------------
     # Blend between FK and IK
-    for i in range(limbJoints):
-        getConstraint = cmds.listConnections( (jointHeirarchy[i]), type="parentConstraint") [0]
+    
+    # The matrix blend drives each main joint's offsetParentMatrix from the IK joint and FK control matrices
+    timer.start("ikFkBlend")
+    if matrixBlend:
+        builder = rigBuilder.getBuilder(networkBackend)
+        rigBuilder.executePlan(builder, plan["matrixBlend"])
+        builder.commit()
+        
+    for getConstraint in blendConstraints:
         getWeights = cmds.parentConstraint(getConstraint, q=1, wal=1)
 
         cmds.connectAttr( (mainControl + "." + limbType + "_" + limbSide + "_IK_FK_switch_CTRL"), (getConstraint + "." + getWeights[1]), f=1)
@@ -143,15 +735,16 @@ def autoLimbTool(*args):
     # Update heirarchy
 
     # Make new joints not visible
-    cmds.setAttr( (jointRoot.replace("_jnt", "_IK_jnt") + ".visibility"), 0)
-    cmds.setAttr( (jointRoot.replace("_jnt", "_FK_jnt") + ".visibility"), 0)
-    cmds.setAttr( (jointRoot.replace("_jnt", "_stretch_jnt") + ".visibility"), 0)
+    timer.start("hierarchy")
+    newRoots = [jointRoot.replace("_jnt", x) for x in newJointList]
+    for newRoot in newRoots:
+        cmds.setAttr( (newRoot + ".visibility"), 0)
     
     # Place new joints into joint heirarchy
     if isArm:
-        cmds.parent( (jointRoot.replace("_jnt", "_IK_jnt")), (jointRoot.replace("_jnt", "_FK_jnt")), (jointRoot.replace("_jnt", "_stretch_jnt")), "clavicle_" + limbSide + "_jnt")
+        cmds.parent( newRoots, "clavicle_" + limbSide + "_jnt")
     else:  
-        cmds.parent( (jointRoot.replace("_jnt", "_IK_jnt")), (jointRoot.replace("_jnt", "_FK_jnt")), (jointRoot.replace("_jnt", "_stretch_jnt")), "root_jnt")
+        cmds.parent( newRoots, "root_jnt")
 
     # clear selection
     cmds.select(cl=1)
@@ -162,6 +755,7 @@ def autoLimbTool(*args):
     # Stretchy Limbs
     
     if stretchCheck:
+        timer.start("stretch")
     
         # Variable for the locator at the end of the joint chain
         stretchEndPosLoc = jointRoot.replace("_jnt", "_stretchEndPos_loc")
@@ -171,133 +765,49 @@ def autoLimbTool(*args):
         cmds.setAttr( (stretchEndPosLoc + ".visibility"), 0)
             
         # Place locator at the end of the limb chain and parent to controller
-        cmds.matchTransform(stretchEndPosLoc, jointHeirarchy[2])
-        cmds.parent(stretchEndPosLoc, jointHeirarchy[2].replace("_jnt", "_IK_ctrl"))
-        
-        # Start building the distance nodes
-        # Add all the distance nodes together using a plusMinusAverage node
-        cmds.shadingNode("plusMinusAverage", au=1, n=jointRoot.replace("_jnt", "_length"))
-        
-        # Build distance nodes for each section
-        for i in range(limbJoints):
-            
-            # Ignore the lat joint or it will try to include the fingers / toes
-            if i is not limbJoints -1:
-                cmds.shadingNode("distanceBetween", au=1, n=jointHeirarchy[i].replace("_jnt", "_distNode"))
-                
-                cmds.connectAttr( jointHeirarchy[i].replace("_jnt", "_stretch_jnt.worldMatrix"), jointHeirarchy[i].replace("_jnt", "_distNode.inMatrix1"), f=1)
-                cmds.connectAttr( jointHeirarchy[i+1].replace("_jnt", "_stretch_jnt.worldMatrix"), jointHeirarchy[i].replace("_jnt", "_distNode.inMatrix2"), f=1)
-                
-                cmds.connectAttr( jointHeirarchy[i].replace("_jnt", "_stretch_jnt.rotatePivotTranslate"), jointHeirarchy[i].replace("_jnt", "_distNode.point1"), f=1)
-                cmds.connectAttr( jointHeirarchy[i+1].replace("_jnt", "_stretch_jnt.rotatePivotTranslate"), jointHeirarchy[i].replace("_jnt", "_distNode.point2"), f=1)
-
-                
-                cmds.connectAttr( jointHeirarchy[i].replace("_jnt", "_distNode.distance"), jointRoot.replace("_jnt", "_length.input1D[" + str(i) + "]"), f=1)
-
-
-        # Get distance between the root and stretch end locator to check if stretching
-        cmds.shadingNode( "distanceBetween", au=1, n=jointRoot.replace("_jnt", "_stretchDistNode"))
-
-        cmds.connectAttr( jointHeirarchy[0].replace("_jnt", "_stretch_jnt.worldMatrix"), (limbName +  "_stretchDistNode.inMatrix1"), f=1)
-        cmds.connectAttr( (stretchEndPosLoc + ".worldMatrix"), (limbName +  "_stretchDistNode.inMatrix2"), f=1)
-                
-        cmds.connectAttr( jointHeirarchy[0].replace("_jnt", "_stretch_jnt.rotatePivotTranslate"), (limbName + "_stretchDistNode.point1"), f=1)
-        cmds.connectAttr( (stretchEndPosLoc + ".rotatePivotTranslate"), (limbName + "_stretchDistNode.point2"), f=1)
-
-        # Create nodes to check for stretching and control if needed
-        
-        # Scale factor compared the length of the leg, with the length of the stretch locator to see if the leg is stretching
-        cmds.shadingNode( "multiplyDivide", au=1, n=jointRoot.replace("_jnt", "_scaleFactor"))  
-        
-        # Conditional node to pass this onto the objects, to control how the leg stretches
-        cmds.shadingNode( "condition", au=1, n=jointRoot.replace("_jnt", "_condition"))  
-        
-        # Adjust node settings
-        cmds.setAttr(jointRoot.replace("_jnt", "_condition.operation"), 2)
-        cmds.setAttr(jointRoot.replace("_jnt", "_condition.secondTerm"), 1)    
-        
-        cmds.setAttr(jointRoot.replace("_jnt", "_scaleFactor.operation"), 2)
-
-        # Connect the stretch distance to the scale factor multiply divide node
-        cmds.connectAttr( (limbName +  "_stretchDistNode.distance"), jointRoot.replace("_jnt", "_scaleFactor.input1X"), f=1)
-        
-        # Connect the full leg distance to the scale factor multiply divide node
-        cmds.connectAttr( jointRoot.replace("_jnt", "_length.output1D"), jointRoot.replace("_jnt", "_scaleFactor.input2X"), f=1)   
-
-        # Connect the scale factor node to the condition node
-        cmds.connectAttr( jointRoot.replace("_jnt", "_scaleFactor.outputX"), jointRoot.replace("_jnt", "_condition.firstTerm"), f=1)
-
-        # Also connect to the color if true attribute, so we can use it as a stretch value
-        cmds.connectAttr( jointRoot.replace("_jnt", "_scaleFactor.outputX"), jointRoot.replace("_jnt", "_condition.colorIfTrueR"), f=1)
-
-        # Connect the consition node to the IK leg joints
-        for i in range(limbJoints):
-            cmds.connectAttr( jointRoot.replace("_jnt", "_condition.outColorR"), jointHeirarchy[i].replace("_jnt", "_IK_jnt.scaleY"), f=1)        
-
-        # Ability to blend between the stretchiness
-        cmds.shadingNode( "blendColors", au=1, n=jointRoot.replace("_jnt", "_blendColors")) 
-        cmds.setAttr( jointRoot.replace("_jnt", "_blendColors.color2"), 1, 0, 0, type="double3" )  
-
-        cmds.connectAttr( jointRoot.replace("_jnt", "_scaleFactor.outputX"), jointRoot.replace("_jnt", "_blendColors.color1R"), f=1) 
-        cmds.connectAttr( jointRoot.replace("_jnt", "_blendColors.outputR"), jointRoot.replace("_jnt", "_condition.colorIfTrueR"), f=1) 
+        cmds.xform(stretchEndPosLoc, ws=1, m=matrices[endJoint])
+        cmds.parent(stretchEndPosLoc, endIkControl)
         
-        # Connect to the paw control attribute
-        cmds.connectAttr( jointHeirarchy[2].replace("_jnt", "_IK_ctrl.Stretchiness"), jointRoot.replace("_jnt", "_blendColors.blender"), f=1) 
+        # Build the whole planned stretch and volume network in one modifier commit
+        builder = rigBuilder.getBuilder(networkBackend)
+        rigBuilder.executePlan(builder, plan["stretch"])
+        builder.commit()
         
-        # Wire up the attributes so we can control how the stretch works
-        cmds.setAttr( jointHeirarchy[2].replace("_jnt", "_IK_ctrl.StretchType"), 0 )
-        cmds.setAttr( jointRoot.replace("_jnt", "_condition.operation"), 1 )  # Not equal (Squash and stretch)
+        # Otherwise the stretch type drives the condition operation through driven keys
+        if not stretchSwitch:
+            # Wire up the attributes so we can control how the stretch works
+            cmds.setAttr( endIkControl + ".StretchType", 0 )
+            cmds.setAttr( jointRoot.replace("_jnt", "_condition.operation"), 1 )  # Not equal (Squash and stretch)
         
-        cmds.setDrivenKeyframe( jointRoot.replace("_jnt", "_condition.operation"), cd=jointHeirarchy[2].replace("_jnt", "_IK_ctrl.StretchType") )
+            cmds.setDrivenKeyframe( jointRoot.replace("_jnt", "_condition.operation"), cd=endIkControl + ".StretchType" )
 
-        cmds.setAttr( jointHeirarchy[2].replace("_jnt", "_IK_ctrl.StretchType"), 1 )
-        cmds.setAttr( jointRoot.replace("_jnt", "_condition.operation"), 3 )  # Greater than (Stretch only)
+            cmds.setAttr( endIkControl + ".StretchType", 1 )
+            cmds.setAttr( jointRoot.replace("_jnt", "_condition.operation"), 3 )  # Greater than (Stretch only)
         
-        cmds.setDrivenKeyframe( jointRoot.replace("_jnt", "_condition.operation"), cd=jointHeirarchy[2].replace("_jnt", "_IK_ctrl.StretchType") )
+            cmds.setDrivenKeyframe( jointRoot.replace("_jnt", "_condition.operation"), cd=endIkControl + ".StretchType" )
 
-        cmds.setAttr( jointHeirarchy[2].replace("_jnt", "_IK_ctrl.StretchType"), 2 )
-        cmds.setAttr( jointRoot.replace("_jnt", "_condition.operation"), 5 )  # Less or equal (Squash only)
+            cmds.setAttr( endIkControl + ".StretchType", 2 )
+            cmds.setAttr( jointRoot.replace("_jnt", "_condition.operation"), 5 )  # Less or equal (Squash only)
         
-        cmds.setDrivenKeyframe( jointRoot.replace("_jnt", "_condition.operation"), cd=jointHeirarchy[2].replace("_jnt", "_IK_ctrl.StretchType") )
+            cmds.setDrivenKeyframe( jointRoot.replace("_jnt", "_condition.operation"), cd=endIkControl + ".StretchType" )
         
-        cmds.setAttr( jointHeirarchy[2].replace("_jnt", "_IK_ctrl.StretchType"), 1 )
+            cmds.setAttr( endIkControl + ".StretchType", 1 )
 
         # clear selection
         cmds.select(cl=1)
-        
-        
-        
-        #---------------------------------------------------------------------
-        # Volume Preservation
-        
-        # Create the main multiply divide node which with calculate the volume
-        cmds.shadingNode( "multiplyDivide", au=1, n=jointRoot.replace("_jnt", "_volume"))
-        
-        # Set opperation to power
-        cmds.setAttr( jointRoot.replace("_jnt", "_volume.operation"), 3 )
-        
-        # Connect main stretch value to the volume node
-        cmds.connectAttr( jointRoot.replace("_jnt", "_blendColors.outputR"), jointRoot.replace("_jnt", "_volume.input1X"), f=1) 
-        
-        # Connect to the condition node to control the scaling
-        cmds.connectAttr( jointRoot.replace("_jnt", "_volume.outputX"), jointRoot.replace("_jnt", "_condition.colorIfTrueG"), f=1)    
-        
-        # Connect to the limb joints
-        cmds.connectAttr( jointRoot.replace("_jnt", "_condition.outColorG"), jointHeirarchy[1] + ".scaleX", f=1)
-        cmds.connectAttr( jointRoot.replace("_jnt", "_condition.outColorG"), jointHeirarchy[1] + ".scaleZ", f=1)
-         
-        cmds.connectAttr( jointRoot.replace("_jnt", "_condition.outColorG"), jointHeirarchy[2] + ".scaleX", f=1)
-        cmds.connectAttr( jointRoot.replace("_jnt", "_condition.outColorG"), jointHeirarchy[2] + ".scaleZ", f=1)
-        
-        # Connect to main volume attribute control
-        cmds.connectAttr( (mainControl + ".Volume_Offset"), jointRoot.replace("_jnt", "_volume.input2X"), f=1)
 
 
 
     #---------------------------------------------------------------------
     # Roll joint systems
     
-    if rollCheck:
+    # Roll joints driven by the twist extracted from the limb matrices, with no follow IK or aims
+    if rollCheck and twistRoll:
+        timer.start("roll")
+        twistRollSystem(limbChain, plan["twist"], matrices)
+        
+    elif rollCheck:
+        timer.start("roll")
     
         # Check which side we are working on so we can move things to the correct side
         if limbSide == "L":
@@ -306,7 +816,7 @@ def autoLimbTool(*args):
             flipSide = -1
 
         # Create the main roll and follow joints
-        rollJointList = [ jointHeirarchy[0], jointHeirarchy[2], jointHeirarchy[0], jointHeirarchy[0]] 
+        rollJointList = [ limbChain[0], endJoint, limbChain[0], limbChain[0]] 
 
         for i in range(len(rollJointList)):
             
@@ -318,7 +828,7 @@ def autoLimbTool(*args):
                 rollJointName = rollJointList[i].replace("_jnt", "_roll_jnt")
                 
             cmds.joint(n=rollJointName, rad=0.6)
-            cmds.matchTransform(rollJointName, rollJointList[i])
+            cmds.xform(rollJointName, ws=1, m=matrices[rollJointList[i]])
             cmds.makeIdentity(rollJointName, a=1, t=0, r=1, s=0,)
             
             if i < 2:
@@ -337,8 +847,9 @@ def autoLimbTool(*args):
         # Upper limb systems
        
         # Adjust the follow joints at the base of the joint chain
-        cmds.pointConstraint( jointHeirarchy[0], jointHeirarchy[1], rollJointList[2].replace("_jnt", "_follow_tip_jnt"), w=1, mo=0, n="tempPC" )
-        cmds.delete("tempPC")
+        # The constraint is only used to place the joint, it is deleted by the name Maya gave it so limbs never clash
+        tempConstraint = cmds.pointConstraint( limbChain[0], limbChain[1], rollJointList[2].replace("_jnt", "_follow_tip_jnt"), w=1, mo=0, n=limbName + "_temp_pointConstraint" )
+        cmds.delete(tempConstraint)
         
         # Move the follow joints out to the side
         cmds.move( 0.8*flipSide, 0, 0, rollJointList[2].replace("_jnt", "_follow_jnt"), r=1, os=1, wd=1 )
@@ -354,14 +865,14 @@ def autoLimbTool(*args):
         cmds.move( 0.8*flipSide, 0, 0, rollJointList[0].replace("_jnt", "_roll_aim_loc"), r=1, os=1, wd=1 )
 
         # Make the root joint aim down the joint chain, but keep looking at the aim locator for reference
-        cmds.aimConstraint( jointHeirarchy[1], rollJointList[0].replace("_jnt", "_roll_jnt"), w=1, aim=(0, -1, 0), u=(1, 0, 0), wut="object", wuo=rollJointList[0].replace("_jnt", "_roll_aim_loc"), mo=1 )
+        cmds.aimConstraint( limbChain[1], rollJointList[0].replace("_jnt", "_roll_jnt"), w=1, aim=(0, -1, 0), u=(1, 0, 0), wut="object", wuo=rollJointList[0].replace("_jnt", "_roll_aim_loc"), mo=1 )
 
         # Make the IK handle for the follow joints
         cmds.ikHandle( n=(limbType + "_" + limbSide + "_follow_IK_handle"), sol="ikRPsolver", sj=rollJointList[2].replace("_jnt", "_follow_jnt"), ee=rollJointList[2].replace("_jnt", "_follow_tip_jnt"))
         
         # Move the handle down to the next joint in the chain (elbow or knee) to that it follows it
-        cmds.parent( limbType + "_" + limbSide + "_follow_IK_handle", jointHeirarchy[1])   
-        cmds.matchTransform( limbType + "_" + limbSide + "_follow_IK_handle", jointHeirarchy[1])
+        cmds.parent( limbType + "_" + limbSide + "_follow_IK_handle", limbChain[1])   
+        cmds.xform( limbType + "_" + limbSide + "_follow_IK_handle", ws=1, m=matrices[limbChain[1]])
         
         # Reset the pole vector so it doesnt rotate around the limb axis
         cmds.setAttr( (limbType + "_" + limbSide + "_follow_IK_handle.poleVectorZ"), 0)
@@ -378,38 +889,42 @@ def autoLimbTool(*args):
 
         # Move locator to the root joint, match it's transformations and parent to the follow joint
         cmds.matchTransform(rollJointList[1].replace("_jnt", "_roll_aim_loc"), rollJointList[1].replace("_jnt", "_roll_jnt"))
-        cmds.parent( rollJointList[1].replace("_jnt", "_roll_aim_loc"), jointHeirarchy[2])
+        cmds.parent( rollJointList[1].replace("_jnt", "_roll_aim_loc"), endJoint)
 
         # Move the locator out to the side
         cmds.move( 0.8*flipSide, 0, 0, rollJointList[1].replace("_jnt", "_roll_aim_loc"), r=1, os=1, wd=1 )
           
-        # Make the wrist / ankle joint aim up the joint chain, but keep looking at the aim locator for reference
-        cmds.aimConstraint( jointHeirarchy[1], rollJointList[1].replace("_jnt", "_roll_jnt"), w=1, aim=(0, 1, 0), u=(1, 0, 0), wut="object", wuo=rollJointList[1].replace("_jnt", "_roll_aim_loc"), mo=1 )
+        # Make the wrist / ankle joint aim up the joint chain at the joint above it, but keep looking at the aim locator for reference
+        cmds.aimConstraint( limbChain[-2], rollJointList[1].replace("_jnt", "_roll_jnt"), w=1, aim=(0, 1, 0), u=(1, 0, 0), wut="object", wuo=rollJointList[1].replace("_jnt", "_roll_aim_loc"), mo=1 )
         
-        # Update heirarchy to parent the follow joints to the main group  
-        if cmds.objExists("systems"):  # If the systems group exists
-            cmds.parentConstraint( "master_ctrl", "systems",  w=1, mo=1 ) # Parent constraint systems as a child of master_ctrl
-            cmds.parent( rollJointList[2].replace("_jnt", "_follow_jnt"), "systems")  # Parent the follow joint chain under systems
-            
-            if isArm:
-                cmds.parentConstraint( "chest_jnt", rollJointList[2].replace("_jnt", "_follow_jnt"),  w=1, mo=1 )  # If working on the arm parent constrain the roll follow joint to the chest joint
-                
-            else:
-                cmds.parentConstraint( "root_jnt", rollJointList[2].replace("_jnt", "_follow_jnt"),  w=1, mo=1 )  # If working on the leg parent constrain the roll follow joint to the root joint
+        # Update heirarchy to parent the follow joints to the main group
+        # A batch passes in the systems group it already set up, a single limb sets it up here
+        if not systems:
+            systems = systemsGroup()
+        cmds.parent( rollJointList[2].replace("_jnt", "_follow_jnt"), systems)  # Parent the follow joint chain under systems
 
+        if isArm:
+            cmds.parentConstraint( "chest_jnt", rollJointList[2].replace("_jnt", "_follow_jnt"),  w=1, mo=1 )  # If working on the arm parent constrain the roll follow joint to the chest joint
+            
         else:
-            cmds.group( em=True, n="systems" )  # Create the systems group
-            cmds.parentConstraint( "master_ctrl", "systems",  w=1, mo=1 ) # Parent constraint systems as a child of master_ctrl
-            cmds.parent( rollJointList[2].replace("_jnt", "_follow_jnt"), "systems")  # Parent the follow joint chain under systems
+            cmds.parentConstraint( "root_jnt", rollJointList[2].replace("_jnt", "_follow_jnt"),  w=1, mo=1 )  # If working on the leg parent constrain the roll follow joint to the root joint
 
-            if isArm:
-                cmds.parentConstraint( "chest_jnt", rollJointList[2].replace("_jnt", "_follow_jnt"),  w=1, mo=1 )  # If working on the arm parent constrain the roll follow joint to the chest joint
-                
-            else:
-                cmds.parentConstraint( "root_jnt", rollJointList[2].replace("_jnt", "_follow_jnt"),  w=1, mo=1 )  # If working on the leg parent constrain the roll follow joint to the root joint
-
-        cmds.setAttr( "systems.visibility", 0)  # Make the systems group non visible
         cmds.select(cl=1)
+
+
+
+    #---------------------------------------------------------------------
+    # Roles the registry lists the limb's nodes under, the rest are listed by node type
+    
+    roles = {"ikJoints": ikJoints, "stretchJoints": [x.replace("_jnt", "_stretch_jnt") for x in limbChain], "limbIkHandle": [ikHandle]}
+    if not matrixBlend:
+        roles["fkJoints"] = fkJoints
+        
+    # The systems group is shared by every limb, so it stays when a limb is torn down
+    if rollCheck and not twistRoll:
+        roles[rigBuilder.sharedRole] = [systems] + (cmds.listRelatives(systems, type="parentConstraint") or [])
+        
+    return roles
     
 
 #---------------------------------------------------------------------
@@ -436,6 +951,10 @@ def autoLimbToolUI():
     rollCheck = cmds.checkBox("rollCheck", l="Roll joints?", h=20, ann="Generate roll joints?", v=0)
     stretchCheck = cmds.checkBox("stretchCheck", l="Stretchy?", h=20, ann="Generate stretchy limbs?", v=0)
     
+    # Joint count
+    jointCountText = cmds.text("jointCountText", l="Limb joints -")
+    jointCountField = cmds.intField("jointCountField", v=3, min=3, w=50, ann="How many joints from the root to the end of the limb? 3 for a standard arm or leg")
+    
     # Separators
     separator01 = cmds.separator(h=5)
     separator02 = cmds.separator(h=5)
@@ -454,12 +973,16 @@ def autoLimbToolUI():
                 ac = [(separator01, 'top', 5, limbMenu),
                     (rollCheck, 'top', 5, separator01),
                     (stretchCheck, 'top', 5, separator01),
-                    (separator02, 'top', 5, rollCheck),
+                    (jointCountText, 'top', 8, rollCheck),
+                    (jointCountField, 'top', 5, rollCheck),
+                    (separator02, 'top', 5, jointCountField),
                     (button, 'top', 5, separator02)
                 ],
                 
                 ap = [(rollCheck, 'left', 0, 15),
-                    (stretchCheck, 'right', 0, 85)                   
+                    (stretchCheck, 'right', 0, 85),
+                    (jointCountText, 'left', 0, 15),
+                    (jointCountField, 'right', 0, 85)
                     
                 ]
     )
@@ -0,0 +1,810 @@
+''' Maya Stand-In - a recording stand-in for maya.cmds and maya.mel, so the tools can run outside Maya '''
+
+import fnmatch
+import itertools
+import sys
+import time
+import types
+
+
+# Node types made as shapes under a transform
+shapeTypes = ("nurbsSurface", "nurbsCurve", "locator", "follicle", "mesh")
+
+# Node types that live in the DAG, every other type is a dependency node
+dagTypes = ("transform", "joint", "ikHandle", "ikEffector", "parentConstraint", "pointConstraint", "orientConstraint",
+            "aimConstraint", "poleVectorConstraint") + shapeTypes
+
+
+class standInScene:
+    '''
+    A minimal in-memory scene graph. Every node has a type, a parent and its attribute values,
+    which is enough for the tools to create, parent, connect and look nodes up as they do in Maya.
+    Children and uuids are indexed as in Maya, so only the lookups that scan the scene in Maya grow with it
+    '''
+    def __init__(self):
+        self.nodes = {}
+        self.childNodes = {}
+        self.uuids = {}
+        self.uuidNodes = {}
+        self.connections = {}
+        self.selection = []
+        self.callbacks = {}
+        self.addedCallbacks = {}
+        self.nodeCallbacks = {}
+        self.attrCallbacks = {}
+        self.removed = 0
+        self.counters = {}
+        self.ui = {}
+
+
+    def uniqueName(self, name):
+        ''' Returns the name, or the name with a number added if a node already has it, as Maya does '''
+        if name not in self.nodes:
+            return name
+        base = name.rstrip("0123456789")
+        count = self.counters.get(base, 0)
+        while True:
+            count += 1
+            if base + str(count) not in self.nodes:
+                self.counters[base] = count
+                return base + str(count)
+
+
+    def add(self, nodeType, name=None, parent=None):
+        ''' Adds a node and returns its name '''
+        name = self.uniqueName(name or nodeType + "1")
+        self.nodes[name] = {"type": nodeType, "parent": None, "attrs": {}}
+        self.addUuid(name)
+        self.setParent(name, parent)
+        for callback in list(self.addedCallbacks.values()):
+            callback(name)
+        return name
+
+
+    def addUuid(self, name):
+        ''' Gives a new node its uuid '''
+        uuid = f"standIn-{len(self.uuids) + self.removed}"
+        self.uuids[name] = uuid
+        self.uuidNodes[uuid] = name
+
+
+    def setParent(self, name, parent):
+        ''' Moves a node under a new parent, or to the world with no parent '''
+        parent = self.short(parent) if parent else None
+        oldParent = self.nodes[name]["parent"]
+        if oldParent in self.childNodes and name in self.childNodes[oldParent]:
+            self.childNodes[oldParent].remove(name)
+        self.nodes[name]["parent"] = parent
+        if parent:
+            self.childNodes.setdefault(parent, []).append(name)
+        self.nodeChanged(name, oldParent, parent)
+
+
+    def nodeChanged(self, *names):
+        ''' Calls the callbacks watching any of the named nodes, as the DAG change and name changed callbacks would '''
+        for name in names:
+            if name in self.uuids:
+                for callback in list(self.nodeCallbacks.get(self.uuids[name], {}).values()):
+                    callback()
+
+
+    def attrChanged(self, name):
+        ''' Calls the attribute changed callbacks watching the named node '''
+        if name in self.uuids:
+            for callback in list(self.attrCallbacks.get(self.uuids[name], {}).values()):
+                callback()
+
+
+    def worldMatrix(self, name):
+        ''' Returns the world matrix of a node as 16 values, only the translation of the node and its parents is modelled '''
+        position = [0.0, 0.0, 0.0]
+        while name:
+            translate = self.nodes[name]["attrs"].get("translate")
+            if isinstance(translate, (list, tuple)):
+                position = [a + b for a, b in zip(position, translate)]
+            name = self.nodes[name]["parent"]
+        return [1.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0] + position + [1.0]
+
+
+    def remove(self, name):
+        ''' Removes a node along with everything under it '''
+        for child in self.children(name):
+            self.remove(child)
+        if name in self.nodes:
+            self.setParent(name, None)
+            self.nodes.pop(name)
+            self.uuidNodes.pop(self.uuids.pop(name))
+            self.removed += 1
+            self.childNodes.pop(name, None)
+
+
+    def rename(self, old, new):
+        ''' Renames a node, keeping its children, parent and uuid '''
+        self.nodeChanged(old)
+        self.nodes[new] = self.nodes.pop(old)
+        self.uuids[new] = self.uuids.pop(old)
+        self.uuidNodes[self.uuids[new]] = new
+        children = self.childNodes.pop(old, [])
+        self.childNodes[new] = children
+        for child in children:
+            self.nodes[child]["parent"] = new
+        parent = self.nodes[new]["parent"]
+        if parent:
+            siblings = self.childNodes[parent]
+            siblings[siblings.index(old)] = new
+
+
+    def short(self, name):
+        ''' Returns the short name of a node given by path, or of the node a plug belongs to '''
+        return name.split(".")[0].rpartition("|")[2]
+
+
+    def exists(self, name):
+        ''' Checks a node or node.attribute exists '''
+        node, _, attr = name.partition(".")
+        node = self.short(node)
+        if node not in self.nodes:
+            return False
+        return not attr or attr in self.nodes[node]["attrs"]
+
+
+    def children(self, name):
+        return list(self.childNodes.get(name, []))
+
+
+    def descendants(self, name):
+        ''' Returns every node under a node, parents before their children '''
+        found = []
+        for child in self.children(name):
+            found.append(child)
+            found += self.descendants(child)
+        return found
+
+
+    def path(self, name):
+        ''' Returns the full path of a node '''
+        parts = [name]
+        while self.nodes[parts[-1]]["parent"]:
+            parts.append(self.nodes[parts[-1]]["parent"])
+        return "|" + "|".join(reversed(parts))
+
+
+class standInCommands:
+    ''' The maya.cmds commands the tools use, working on a standInScene '''
+    def __init__(self, scene):
+        self.scene = scene
+
+
+    def createNode(self, nodeType, n=None, name=None, p=None, parent=None, ss=False, **kwargs):
+        node = self.scene.add(nodeType, n or name, p or parent)
+        if not ss:
+            self.scene.selection = [node]
+        return node
+
+
+    def shapeNode(self, nodeType, name):
+        ''' Makes a transform with a shape under it, returning the transform '''
+        transform = self.scene.add("transform", name)
+        self.scene.add(nodeType, transform + "Shape", transform)
+        return transform
+
+
+    def group(self, *nodes, em=False, n=None, name=None, **kwargs):
+        group = self.scene.add("transform", n or name or "group1")
+        for node in nodes:
+            self.scene.setParent(self.scene.short(node), group)
+        return group
+
+
+    def joint(self, n=None, name=None, p=None, **kwargs):
+        # New joints go under the selected joint, as cmds.joint does
+        selected = [x for x in self.scene.selection if self.scene.nodes.get(x, {}).get("type") == "joint"]
+        node = self.scene.add("joint", n or name, selected[0] if selected else None)
+        self.scene.selection = [node]
+        return node
+
+
+    def spaceLocator(self, n=None, name=None, **kwargs):
+        return [self.shapeNode("locator", n or name or "locator1")]
+
+
+    def nurbsPlane(self, n=None, name=None, u=1, v=1, d=3, **kwargs):
+        # The shape keeps its spans and degree, which is all the surface function set is asked for
+        plane = self.shapeNode("nurbsSurface", n or name or "nurbsPlane1")
+        self.scene.nodes[plane + "Shape"]["attrs"].update({"spansU": u, "spansV": v, "degreeUV": d})
+        return [plane, self.scene.add("makeNurbPlane")]
+
+
+    def insertKnotSurface(self, surface, nk=1, **kwargs):
+        shape = self.scene.children(self.scene.short(surface))[0]
+        self.scene.nodes[shape]["attrs"]["spansU"] = self.scene.nodes[shape]["attrs"].get("spansU", 1) + nk
+        return [self.scene.short(surface), self.scene.add("insertKnotSurface")]
+
+
+    def duplicate(self, node, n=None, name=None, **kwargs):
+        nodeType = self.scene.nodes[self.scene.short(node)]["type"]
+        shapes = self.listRelatives(node, s=1) or []
+        if shapes:
+            return [self.shapeNode(self.scene.nodes[shapes[0]]["type"], n or name or node)]
+        return [self.scene.add(nodeType, n or name or node)]
+
+
+    def nonLinear(self, *objects, type="bend", **kwargs):
+        return [self.scene.add("nonLinear", type + "1"), self.shapeNode("deform" + type.capitalize(), type + "1Handle")]
+
+
+    def blendShape(self, *objects, n=None, name=None, **kwargs):
+        return [self.scene.add("blendShape", n or name or "blendShape1")]
+
+
+    def skinCluster(self, *objects, n=None, name=None, **kwargs):
+        return [self.scene.add("skinCluster", n or name or "skinCluster1")]
+
+
+    def constraint(self, constraintType, objects, n=None, q=False, wal=False):
+        ''' Makes a constraint under the last object, or lists its weight aliases when queried '''
+        if q:
+            return [f"W{i}" for i in range(2)]
+        target = self.scene.short(objects[-1])
+        return [self.scene.add(constraintType, n or f"{target}_{constraintType}1", target)]
+
+
+    def parentConstraint(self, *objects, n=None, q=False, wal=False, **kwargs):
+        return self.constraint("parentConstraint", objects, n, q, wal)
+
+
+    def pointConstraint(self, *objects, n=None, q=False, wal=False, **kwargs):
+        return self.constraint("pointConstraint", objects, n, q, wal)
+
+
+    def orientConstraint(self, *objects, n=None, q=False, wal=False, **kwargs):
+        return self.constraint("orientConstraint", objects, n, q, wal)
+
+
+    def aimConstraint(self, *objects, n=None, q=False, wal=False, **kwargs):
+        return self.constraint("aimConstraint", objects, n, q, wal)
+
+
+    def poleVectorConstraint(self, *objects, n=None, q=False, wal=False, **kwargs):
+        return self.constraint("poleVectorConstraint", objects, n, q, wal)
+
+
+    def ikHandle(self, n=None, name=None, **kwargs):
+        return [self.scene.add("ikHandle", n or name or "ikHandle1"), self.scene.add("ikEffector", "effector1")]
+
+
+    def listRelatives(self, node, s=False, p=False, c=False, ad=False, type=None, ni=False, f=False, fullPath=False, **kwargs):
+        node = self.scene.short(node)
+        if p:
+            found = [self.scene.nodes[node]["parent"]] if self.scene.nodes[node]["parent"] else []
+        elif ad:
+            # Maya lists descendants deepest first
+            found = list(reversed(self.scene.descendants(node)))
+        else:
+            found = self.scene.children(node)
+            if s:
+                found = [x for x in found if self.scene.nodes[x]["type"] in shapeTypes]
+        if type:
+            found = [x for x in found if self.scene.nodes[x]["type"] == type]
+        if f or fullPath:
+            found = [self.scene.path(x) for x in found]
+        # Maya returns None rather than an empty list
+        return found or None
+
+
+    def ls(self, *names, sl=False, type=None, dag=False, long=False, uuid=False, showType=False, **kwargs):
+        scene = self.scene
+        if sl:
+            found = list(scene.selection)
+        elif names:
+            patterns = names[0] if isinstance(names[0], (list, tuple)) else names
+            found = []
+            for pattern in patterns:
+                if "." in pattern:
+                    found += [pattern] if scene.exists(pattern) else []
+                elif any(x in pattern for x in "*?["):
+                    found += fnmatch.filter(scene.nodes, pattern)
+                elif scene.short(pattern) in scene.nodes:
+                    found.append(scene.short(pattern))
+                elif pattern in scene.uuidNodes:
+                    found.append(scene.uuidNodes[pattern])
+        else:
+            found = list(scene.nodes)
+        if dag:
+            found = [x for node in found for x in [node] + scene.descendants(node)]
+        if type:
+            types = [type] if isinstance(type, str) else type
+            found = [x for x in found if "." not in x and scene.nodes[x]["type"] in types]
+        if uuid:
+            return [scene.uuids[x] for x in found]
+        if showType:
+            return [x for node in found for x in (scene.path(node) if long else node, scene.nodes[scene.short(node)]["type"])]
+        if long:
+            return [scene.path(x) if "." not in x else x for x in found]
+        return found
+
+
+    def objExists(self, name):
+        return self.scene.exists(name)
+
+
+    def nodeType(self, name, isTypeName=False, inherited=False, **kwargs):
+        if isTypeName:
+            # Only whether a type inherits from dagNode is asked of the type tree
+            return ["dagNode", name] if name in dagTypes else [name]
+        return self.scene.nodes[self.scene.short(name)]["type"]
+
+
+    def parent(self, *args, r=False, w=False, **kwargs):
+        # Nodes can be given one by one or as a list, the last argument is the new parent
+        nodes = [x for arg in args[:-1] for x in ([arg] if isinstance(arg, str) else arg)] if not w else list(args)
+        parent = None if w else self.scene.short(args[-1])
+        for node in nodes:
+            self.scene.setParent(self.scene.short(node), parent)
+        return [self.scene.short(x) for x in nodes]
+
+
+    def rename(self, old, new):
+        scene = self.scene
+        old = scene.short(old)
+        new = scene.uniqueName(new)
+        scene.rename(old, new)
+        scene.selection = [new if x == old else x for x in scene.selection]
+        return new
+
+
+    def delete(self, *nodes, **kwargs):
+        for node in nodes:
+            for name in ([node] if isinstance(node, str) else node):
+                self.scene.remove(self.scene.short(name))
+
+
+    def select(self, *nodes, cl=False, r=False, add=False, **kwargs):
+        if cl:
+            self.scene.selection = []
+        else:
+            self.scene.selection = [self.scene.short(x) for node in nodes for x in ([node] if isinstance(node, str) else node)]
+
+
+    def setAttr(self, plug, *values, l=None, type=None, **kwargs):
+        node, _, attr = plug.partition(".")
+        attrs = self.scene.nodes[self.scene.short(node)]["attrs"]
+        if values:
+            attrs[attr] = values if len(values) > 1 else values[0]
+        else:
+            attrs.setdefault(attr, 0)
+        self.scene.attrChanged(self.scene.short(node))
+
+
+    def getAttr(self, plug, **kwargs):
+        node, _, attr = plug.partition(".")
+        return self.scene.nodes[self.scene.short(node)]["attrs"].get(attr, 0)
+
+
+    def addAttr(self, node, ln=None, longName=None, dv=0, **kwargs):
+        self.scene.nodes[self.scene.short(node)]["attrs"][ln or longName] = dv
+
+
+    def connectAttr(self, src, dst, f=False, **kwargs):
+        for plug in (src, dst):
+            node, _, attr = plug.partition(".")
+            self.scene.nodes[self.scene.short(node)]["attrs"].setdefault(attr, 0)
+            self.scene.attrChanged(self.scene.short(node))
+        self.scene.connections[dst] = src
+
+
+    def xform(self, nodes, q=False, t=False, ro=None, m=None, **kwargs):
+        nodes = [nodes] if isinstance(nodes, str) else nodes
+        if q and t:
+            values = []
+            for node in nodes:
+                translate = self.getAttr(node + ".translate")
+                values += list(translate) if isinstance(translate, (list, tuple)) else [0, 0, 0]
+            return values
+        # Values are set as given, as if the nodes sat under parents at the origin
+        for node in nodes:
+            if m:
+                self.setAttr(node + ".translate", *m[12:15])
+            if t:
+                self.setAttr(node + ".translate", *t)
+            if ro:
+                self.setAttr(node + ".rotate", *ro)
+
+
+    def matchTransform(self, node, target, **kwargs):
+        translate = self.getAttr(target + ".translate")
+        if translate:
+            self.setAttr(node + ".translate", *translate)
+
+
+    def pluginInfo(self, name, q=False, loaded=False, **kwargs):
+        return True
+
+
+    def rigBuilderCommit(self):
+        # Runs the next waiting commit, as the rigBuilderCommit plugin command does
+        import rigBuilder
+        rigBuilder.pendingCommits.pop(0).doIt()
+
+
+    def uiQuery(self, control, q=False, default=None, **kwargs):
+        ''' UI controls return the values set on the scene for them when queried '''
+        if q:
+            return self.scene.ui.get(control, default)
+        return control
+
+
+    def optionMenu(self, control, **kwargs):
+        return self.uiQuery(control, default="", **kwargs)
+
+
+    def checkBox(self, control, **kwargs):
+        return self.uiQuery(control, default=False, **kwargs)
+
+
+    def intField(self, control, **kwargs):
+        return self.uiQuery(control, default=0, **kwargs)
+
+
+    def floatField(self, control, **kwargs):
+        return self.uiQuery(control, default=0.0, **kwargs)
+
+
+    def textField(self, control, **kwargs):
+        return self.uiQuery(control, default="", **kwargs)
+
+
+    def colorSliderGrp(self, control, **kwargs):
+        return self.uiQuery(control, default=(1.0, 1.0, 1.0), **kwargs)
+
+
+    def error(self, message):
+        # cmds.error raises in Maya too
+        raise RuntimeError(message)
+
+
+class recordingCmds:
+    '''
+    Stands in for the maya.cmds module. Every command is recorded with its arguments and how long it took,
+    commands the stand-in does not model are recorded and return None
+    '''
+    def __init__(self):
+        self.reset()
+
+
+    def reset(self):
+        ''' Starts again with an empty scene and an empty record '''
+        self.scene = standInScene()
+        self.commands = standInCommands(self.scene)
+        self.calls = []
+
+
+    def __getattr__(self, commandName):
+        command = getattr(self.commands, commandName, None)
+        def recordedCommand(*args, **kwargs):
+            return self.record(commandName, command, *args, **kwargs)
+        return recordedCommand
+
+
+    def record(self, commandName, command, *args, **kwargs):
+        ''' Runs a command, or nothing if it is None, and records the call '''
+        start = time.perf_counter()
+        try:
+            return command(*args, **kwargs) if command else None
+        finally:
+            self.calls.append((commandName, args, kwargs, time.perf_counter() - start))
+
+
+    def counts(self):
+        ''' Returns the number of calls made of each command '''
+        counts = {}
+        for commandName, args, kwargs, duration in self.calls:
+            counts[commandName] = counts.get(commandName, 0) + 1
+        return counts
+
+
+class recordingMel:
+    ''' Stands in for the maya.mel module, recording every script it is asked to run '''
+    def __init__(self):
+        self.calls = []
+
+
+    def eval(self, script):
+        self.calls.append(script)
+
+
+def openMayaStandIn(cmds):
+    '''
+    The parts of maya.api.OpenMaya the tools touch: scene change callbacks, node uuids, the surface and skin weight
+    function sets and the DAG modifier. Modifier operations are recorded as calls and applied as they are queued,
+    nothing reads the scene between queueing and the doIt
+    '''
+    om = types.ModuleType("maya.api.OpenMaya")
+    # Ids just need to be unique
+    nextId = itertools.count(1)
+
+    def addCallback(*args):
+        # Scene callbacks are handed the function as the first or second argument, they are kept but never called
+        # as the stand-in starts a new scene with a reset rather than a new scene message
+        function = next(x for x in args if callable(x))
+        callbackId = next(nextId)
+        cmds.scene.callbacks[callbackId] = function
+        return callbackId
+
+    def addNodeAddedCallback(function, nodeType="dependNode", clientData=None):
+        # Node added callbacks are handed the new node, as an MObject that knows its uuid
+        callbackId = next(nextId)
+        cmds.scene.addedCallbacks[callbackId] = lambda name: function(om.MObject(cmds.scene.uuids[name]), clientData)
+        return callbackId
+
+    def addNodeCallback(node, function):
+        # Callbacks on one node are handed to the scene by the node's uuid, so they follow it through renames
+        callbackId = next(nextId)
+        cmds.scene.nodeCallbacks.setdefault(node.uuid, {})[callbackId] = lambda: function(None, None)
+        return callbackId
+
+    def addAttributeChangedCallback(node, function):
+        callbackId = next(nextId)
+        cmds.scene.attrCallbacks.setdefault(node.uuid, {})[callbackId] = lambda: function(None, None, None, None)
+        return callbackId
+
+    def removeCallbacks(callbackIds):
+        for callbackId in callbackIds:
+            cmds.scene.callbacks.pop(callbackId, None)
+            cmds.scene.addedCallbacks.pop(callbackId, None)
+            for callbacks in list(cmds.scene.nodeCallbacks.values()) + list(cmds.scene.attrCallbacks.values()):
+                callbacks.pop(callbackId, None)
+
+    MFn = types.SimpleNamespace(kDagNode=0, kUnitAttribute=1, kEnumAttribute=2, kNumericAttribute=3, kSurfaceCVComponent=4)
+
+    def nodeName(node):
+        return cmds.scene.uuidNodes[node.uuid]
+
+    class MObject:
+        kNullObj = None
+
+        def __init__(self, uuid=None):
+            self.uuid = uuid
+
+        def hasFn(self, fn):
+            return fn == MFn.kDagNode and cmds.scene.nodes[nodeName(self)]["type"] in dagTypes
+
+    class MAttribute:
+        ''' An attribute by name, none of them are unit, enum or numeric attributes to the stand-in '''
+        def __init__(self, name, default=0):
+            self.name = name
+            self.default = default
+
+        def hasFn(self, fn):
+            return False
+
+    class MPlug:
+        ''' A plug by its attribute path, a child index picks one value of a compound such as translate '''
+        def __init__(self, node, attribute, index=None):
+            self.node = node
+            self.attr = attribute
+            self.index = index
+            self.isLocked = False
+
+        def name(self):
+            return f"{nodeName(self.node)}.{self.attr.name}"
+
+        def attribute(self):
+            return self.attr
+
+        def child(self, child):
+            if isinstance(child, int):
+                return MPlug(self.node, self.attr, child)
+            return MPlug(self.node, MAttribute(f"{self.attr.name}.{child.name}"))
+
+        def elementByLogicalIndex(self, index):
+            return MPlug(self.node, MAttribute(f"{self.attr.name}[{index}]"))
+
+        @property
+        def isDestination(self):
+            return self.name() in cmds.scene.connections
+
+        def source(self):
+            node, _, attr = cmds.scene.connections[self.name()].partition(".")
+            return MPlug(MObject(cmds.scene.uuids[node]), MAttribute(attr))
+
+        def setValue(self, value):
+            attrs = cmds.scene.nodes[nodeName(self.node)]["attrs"]
+            cmds.scene.attrChanged(nodeName(self.node))
+            if self.index is None:
+                attrs[self.attr.name] = value
+                return
+            values = list(attrs.get(self.attr.name) or [0, 0, 0])
+            values[self.index] = value
+            attrs[self.attr.name] = tuple(values)
+
+    class MSelectionList:
+        def __init__(self):
+            self.nodes = []
+
+        def add(self, name):
+            self.nodes.append(MObject(cmds.scene.uuids[cmds.scene.short(name)]))
+            return self
+
+        def getDependNode(self, index):
+            return self.nodes[index]
+
+        def getDagPath(self, index):
+            return MDagPath(self.nodes[index].uuid)
+
+    class MDagPath(MObject):
+        def inclusiveMatrix(self):
+            return cmds.scene.worldMatrix(nodeName(self))
+
+    class MFnDependencyNode:
+        def __init__(self, node):
+            self.node = node
+
+        def uuid(self):
+            return types.SimpleNamespace(asString=lambda: self.node.uuid)
+
+        def name(self):
+            return nodeName(self.node)
+
+        def attribute(self, name):
+            return MAttribute(name)
+
+        def findPlug(self, name, wantNetworkedPlug):
+            return MPlug(self.node, MAttribute(name))
+
+    class MFnDagNode(MFnDependencyNode):
+        def partialPathName(self):
+            return nodeName(self.node)
+
+    class MObjectHandle:
+        def __init__(self, node):
+            self.node = node
+
+        def hashCode(self):
+            return hash(self.node.uuid)
+
+    class MDGModifier:
+        ''' Applies each operation straight away, recording it as a call named after the modifier and operation '''
+        def record(self, operation, function, *args):
+            return cmds.record(f"{type(self).__name__}.{operation}", function, *args)
+
+        def createNode(self, nodeType):
+            return self.record("createNode", lambda: MObject(cmds.scene.uuids[cmds.scene.add(nodeType)]))
+
+        def renameNode(self, node, name):
+            self.record("renameNode", lambda: cmds.commands.rename(nodeName(node), name))
+
+        def newPlugValue(self, plug, value):
+            self.record("newPlugValue", plug.setValue, value)
+
+        newPlugValueDouble = newPlugValueInt = newPlugValueBool = newPlugValueString = newPlugValue
+        newPlugValueMAngle = newPlugValueMDistance = newPlugValue
+
+        def connect(self, src, dst):
+            self.record("connect", lambda: cmds.commands.connectAttr(src.name(), dst.name()))
+
+        def disconnect(self, src, dst):
+            self.record("disconnect", lambda: cmds.scene.connections.pop(dst.name(), None))
+
+        def addAttribute(self, node, attribute):
+            self.record("addAttribute", lambda: cmds.scene.nodes[nodeName(node)]["attrs"].setdefault(attribute.name, attribute.default))
+
+        def doIt(self):
+            self.record("doIt", None)
+
+        def undoIt(self):
+            self.record("undoIt", None)
+
+    class MDagModifier(MDGModifier):
+        def createNode(self, nodeType, parent=None):
+            def create():
+                # Shapes made without a parent get a transform, which is what the modifier hands back
+                if nodeType in shapeTypes and parent is None:
+                    return MObject(cmds.scene.uuids[cmds.commands.shapeNode(nodeType, nodeType + "1")])
+                return MObject(cmds.scene.uuids[cmds.scene.add(nodeType, None, nodeName(parent) if parent else None)])
+            return self.record("createNode", create)
+
+        def reparentNode(self, node, parent):
+            self.record("reparentNode", lambda: cmds.scene.setParent(nodeName(node), nodeName(parent)))
+
+    class MFnNumericAttribute:
+        def create(self, longName, shortName, numericType, default=0):
+            self.keyable = True
+            return MAttribute(longName, default)
+
+        def setMin(self, value):
+            pass
+
+        def setMax(self, value):
+            pass
+
+    class MFnEnumAttribute(MFnNumericAttribute):
+        def create(self, longName, shortName, default=0):
+            return super().create(longName, shortName, None, default)
+
+        def addField(self, field, value):
+            pass
+
+    class MFnNurbsSurface:
+        ''' Reads the spans and degree kept on a stand-in surface, with knots spaced one apart as nurbsPlane makes them '''
+        def __init__(self, dagPath):
+            shape = nodeName(dagPath)
+            if cmds.scene.nodes[shape]["type"] != "nurbsSurface":
+                shape = cmds.scene.children(shape)[0]
+            attrs = cmds.scene.nodes[shape]["attrs"]
+            self.degreeInU = attrs.get("degreeUV", 3)
+            self.spansU = attrs.get("spansU", 1)
+            self.numCVsInU = self.spansU + self.degreeInU
+            self.numCVsInV = attrs.get("spansV", 1) + self.degreeInU
+
+        def knotsInU(self):
+            return [0] * self.degreeInU + list(range(1, self.spansU)) + [self.spansU] * self.degreeInU
+
+    class MFnDoubleIndexedComponent:
+        def create(self, componentType):
+            self.elements = []
+            return self.elements
+
+        def addElements(self, elements):
+            self.elements += elements
+
+    om.MFn = MFn
+    om.MObject = MObject
+    om.MPlug = MPlug
+    om.MFnDependencyNode = MFnDependencyNode
+    om.MFnDagNode = MFnDagNode
+    om.MObjectHandle = MObjectHandle
+    om.MSelectionList = MSelectionList
+    om.MDGModifier = MDGModifier
+    om.MDagModifier = MDagModifier
+    om.MFnNumericAttribute = MFnNumericAttribute
+    om.MFnEnumAttribute = MFnEnumAttribute
+    om.MFnNumericData = types.SimpleNamespace(kBoolean=0, kByte=1, kChar=2, kShort=3, kInt=4, kFloat=5, kDouble=6)
+    om.MFnUnitAttribute = types.SimpleNamespace(kAngle=0, kDistance=1)
+    om.MFnNurbsSurface = MFnNurbsSurface
+    om.MFnNurbsCurve = lambda: types.SimpleNamespace(create=lambda *args: None)
+    om.MFnNurbsCurveData = lambda: types.SimpleNamespace(create=lambda: {"type": "nurbsCurve"})
+    om.MPoint = tuple
+    om.MFnDoubleIndexedComponent = MFnDoubleIndexedComponent
+    om.MIntArray = om.MDoubleArray = list
+    om.MSceneMessage = types.SimpleNamespace(addCallback=addCallback, kAfterNew=0, kAfterOpen=1)
+    om.MDGMessage = types.SimpleNamespace(addNodeAddedCallback=addNodeAddedCallback, addTimeChangeCallback=addCallback)
+    om.MDagMessage = types.SimpleNamespace(addAllDagChangesDagPathCallback=addNodeCallback)
+    om.MNodeMessage = types.SimpleNamespace(addNameChangedCallback=addNodeCallback, addAttributeChangedCallback=addAttributeChangedCallback)
+    om.MMessage = types.SimpleNamespace(removeCallbacks=removeCallbacks, removeCallback=lambda x: removeCallbacks([x]))
+    return om
+
+
+def openMayaAnimStandIn(cmds):
+    ''' The skin cluster function set, which keeps the weights it is given on the skinCluster node '''
+    oma = types.ModuleType("maya.api.OpenMayaAnim")
+
+    class MFnSkinCluster:
+        def __init__(self, node):
+            self.attrs = cmds.scene.nodes[cmds.scene.uuidNodes[node.uuid]]["attrs"]
+
+        def setWeights(self, shape, components, influences, weights, normalize=True, returnOldWeights=False):
+            oldWeights = self.attrs.get("weightList", [])
+            self.attrs["weightList"] = list(weights)
+            return oldWeights if returnOldWeights else None
+
+    oma.MFnSkinCluster = MFnSkinCluster
+    return oma
+
+
+def install():
+    '''
+    Puts the stand-in in place of the maya package, so the tools can be imported and run outside Maya.
+    Returns the recording cmds, reset it to start each run with an empty scene
+    '''
+    cmds = recordingCmds()
+    maya = types.ModuleType("maya")
+    api = types.ModuleType("maya.api")
+    maya.cmds = cmds
+    maya.mel = recordingMel()
+    maya.api = api
+    api.OpenMaya = openMayaStandIn(cmds)
+    api.OpenMayaAnim = openMayaAnimStandIn(cmds)
+    sys.modules.update({"maya": maya, "maya.cmds": cmds, "maya.mel": maya.mel, "maya.api": api,
+                        "maya.api.OpenMaya": api.OpenMaya, "maya.api.OpenMayaAnim": api.OpenMayaAnim})
+    return cmds
@@ -1,226 +1,760 @@
 ''' Ribbon Tool v1.2 '''
 
+import math
+import sys
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, replace
+
 import maya.cmds as cmds
-import maya.mel as mm
+import maya.api.OpenMaya as om
+
+import rigBuilder
+import skeletonIndex
+
+
+# Plans already worked out, by the settings they were planned from, least recently used first
+planCache = {}
+
+# Most plans kept in the cache
+planCacheSize = 32
+
+
+@dataclass
+class ribbonSettings:
+    ''' Holds every setting needed to build a ribbon, so ribbons can be built without the UI '''
+    name: str = ""
+    length: float = 2.5
+    direction: str = "Horizontal"
+    axis: str = "Z"
+    jointAxis: str = "X"
+    jointInvert: bool = False
+    insertIsoparm: bool = False
+    hideJoints: bool = False
+    hideFollicles: bool = False
+    ctrlScale: float = 1.0
+    ctrlColour: tuple = (1.0, 1.0, 1.0)
+    altColour: tuple = (1.0, 1.0, 1.0)
+    altColourCheck: bool = False
+    jointSnap: bool = False
+    snapRoot: str = ""
+    endOrient: bool = False
+    bindCount: int = 9
+    ctrlCount: int = 5
+    spans: int = 0
+    backend: str = "cmds"
+    attach: str = "follicle"
+    deformStack: str = "blendShape"
+    skinWeights: str = "auto"
+    maxInfluences: int = 2
+    ctrlShape: str = "circle"
+    timing: bool = False
+    timingCommands: bool = False
+    timingLog: str = ""
+
+
+def controlNames(name, count):
+    ''' Names for the control joints along the ribbon, 5 controls keep the base / upper / mid / lower / end names '''
+    if count == 5:
+        labels = ["base", "upper", "mid", "lower", "end"]
+    elif count == 3:
+        labels = ["base", "mid", "end"]
+    else:
+        labels = ["base"] + [f"mid{c:02}" for c in range(1, count - 1)] + ["end"]
+    return [f"{name}_{label}" for label in labels]
+
+
+def ribbonOrients(settings):
+    ''' Returns the plane axis of the surface and the joint orients that match the ribbon joints to the joint chain axis '''
+    # Sets plane axis value for the nurbs surface based on the chosen facing axis
+    if settings.axis == "X":
+        planeAxis = [1, 0, 0]
+    elif settings.axis == "Y":
+        planeAxis = [0, 1 ,0]
+    else:
+        planeAxis = [0, 0, 1]
+                
+    # Sets joint orient values to rotate the created joints to match the joing chain axis
+    if not settings.jointInvert:
+        if settings.jointAxis == "X":
+            jointOrient = [-90, 0, 0]
+        elif settings.jointAxis == "Y":
+            jointOrient = [0, 180, -90]
+        else:
+            jointOrient = [0, 90, 0]
+    else:
+        if settings.jointAxis == "X":
+            jointOrient = [-90, -180, 0]
+        elif settings.jointAxis == "Y":
+            jointOrient = [0, 0, 90]
+        else:
+            jointOrient = [0, -90, 0]    
+    endJointOrient = [0, 0, 0]
+    if not settings.endOrient:
+        endJointOrient = jointOrient
+    return planeAxis, jointOrient, endJointOrient
+
+
+def ribbonNames(settings):
+    ''' Every node name a ribbon build gives its nodes, worked out from the settings without touching the scene '''
+    name = settings.name
+    # The ribbon name itself is included, no other node may have it
+    names = [name, name+rigBuilder.registrySuffix, name+"_ribbon", name+"_ribbonShape", name+"_deform", name+"_offset_grp", name+"_ribbon_grp",
+             name+"_sine_def", name+"_twist_def", name+"_sine_handle", name+"_twist_handle"]
+    if settings.deformStack != "surface":
+        names += [name+"_twist", name+"_sine", name+"_bShape"]
+    if settings.attach == "uvPin":
+        names += [name+"_pins", name+"_uvPin"]
+    else:
+        names.append(name+"_follicles")
+        for c in range(settings.bindCount):
+            names += [f"{name}_follicle_{c:02}", f"{name}_follicle_{c:02}Shape"]
+    names += [f"{name}_bind_{c:02}" for c in range(settings.bindCount)]
+    for c, value in enumerate(controlNames(name, settings.ctrlCount)):
+        names += [value+"_offset", value+"_grp", value+"_ctrl_grp", value+"_ctrl", value+"_ctrlShape", value+"_jnt"]
+        if c % 2:
+            names += [value+"_aim", value+"_aimpoint"]
+    return names
+
+
+def eulerToMatrix(rotation):
+    ''' Converts an XYZ euler rotation in degrees to a 3x3 rotation matrix, using Maya's row vector convention '''
+    x, y, z = [math.radians(value) for value in rotation]
+    rotX = [[1, 0, 0], [0, math.cos(x), math.sin(x)], [0, -math.sin(x), math.cos(x)]]
+    rotY = [[math.cos(y), 0, -math.sin(y)], [0, 1, 0], [math.sin(y), 0, math.cos(y)]]
+    rotZ = [[math.cos(z), math.sin(z), 0], [-math.sin(z), math.cos(z), 0], [0, 0, 1]]
+    return multMatrix(multMatrix(rotX, rotY), rotZ)
+
+
+def multMatrix(a, b):
+    ''' Multiplies two 3x3 matrices '''
+    return [[sum(a[row][i] * b[i][col] for i in range(3)) for col in range(3)] for row in range(3)]
+
+
+def matrixRotation(matrix):
+    ''' Returns the 3x3 rotation of a flat 4x4 matrix, with any scale taken out of its rows '''
+    rows = [matrix[i * 4:i * 4 + 3] for i in range(3)]
+    return [[value / (math.sqrt(sum(x * x for x in row)) or 1.0) for value in row] for row in rows]
+
+
+def matrixToEuler(matrix):
+    ''' Converts a 3x3 rotation matrix back to an XYZ euler rotation in degrees '''
+    sinY = max(-1.0, min(1.0, -matrix[0][2]))
+    y = math.asin(sinY)
+    if abs(math.cos(y)) > 1e-6:
+        x = math.atan2(matrix[1][2], matrix[2][2])
+        z = math.atan2(matrix[0][1], matrix[0][0])
+    else:
+        # Gimbal lock, all of the remaining rotation goes into X
+        x = math.atan2(matrix[1][0] * sinY, matrix[1][1])
+        z = 0.0
+    return [math.degrees(x), math.degrees(y), math.degrees(z)]
+
+
+def surfaceFrame(settings):
+    ''' Returns the U direction, V direction and normal of the ribbon plane as the rows of a matrix '''
+    if settings.axis == "X":
+        frame = [[0, 0, -1], [0, 1, 0], [1, 0, 0]]
+    elif settings.axis == "Y":
+        frame = [[1, 0, 0], [0, 0, -1], [0, 1, 0]]
+    else:
+        frame = [[1, 0, 0], [0, 1, 0], [0, 0, 1]]
+    # Vertical ribbons are rotated -90 around the facing axis and frozen
+    if settings.direction == "Vertical":
+        rotation = [0, 0, 0]
+        rotation["XYZ".index(settings.axis)] = -90
+        frame = multMatrix(frame, eulerToMatrix(rotation))
+    return frame
+
+
+def surfacePoints(settings, uValues, vValue=0.5):
+    ''' 
+    Returns the world positions of a list of U parameters on the ribbon plane. The plane this tool builds
+    is flat and evenly parameterised, so every point is computed directly rather than queried from the scene
+    '''
+    frame = surfaceFrame(settings)
+    width = settings.length
+    height = settings.length * 0.15
+    positions = []
+    for u in uValues:
+        positions.append([(u - 0.5) * width * frame[0][i] + (vValue - 0.5) * height * frame[1][i] for i in range(3)])
+    return positions
+
+
+def jointTransforms(settings, bindCount, ctrlU, jointOrient, endJointOrient):
+    ''' 
+    Works out the transforms of every bind and control joint in one pass. Bind joints sit under their follicle
+    and only need the orient offset as a joint orient. Control joints get the surface orientation turned by the
+    same offset, as world space positions and rotations. The first joint of each uses endJointOrient
+    '''
+    frame = surfaceFrame(settings)
+    offsets = [eulerToMatrix(endJointOrient), eulerToMatrix(jointOrient)]
+    ctrlRotations = [matrixToEuler(multMatrix(offsets[min(c, 1)], frame)) for c in range(len(ctrlU))]
+    bindOrients = [list(endJointOrient)] + [list(jointOrient)] * (bindCount - 1)
+    return bindOrients, list(zip(surfacePoints(settings, ctrlU), ctrlRotations))
+
+
+def surfaceCVParameters(shape):
+    ''' 
+    Returns the CV count in U and V of a NURBS surface and the U parameter of each CV column, from 0 to 1.
+    Each column's parameter is the average of its knots, which is where that CV pulls the surface most
+    '''
+    surfaceFn = om.MFnNurbsSurface(om.MSelectionList().add(shape).getDagPath(0))
+    knots = list(surfaceFn.knotsInU())
+    degree = surfaceFn.degreeInU
+    start = knots[0]
+    span = knots[-1] - start
+    cvU = [(sum(knots[i:i+degree]) / degree - start) / span for i in range(surfaceFn.numCVsInU)]
+    return surfaceFn.numCVsInU, surfaceFn.numCVsInV, cvU
+
+
+def skinWeights(cvU, jointU, falloff="linear", maxInfluences=2):
+    ''' 
+    Works out skin weights from the U parameter of each CV and of each control joint. A joint's weight falls off
+    over the gap between joints, widened when more influences are allowed, either linearly or smoothly.
+    Only the strongest maxInfluences weights are kept, at least one. Returns a normalised row of weights per CV, one per joint
+    '''
+    radius = (jointU[-1] - jointU[0]) / (len(jointU) - 1) * max(maxInfluences, 2) / 2
+    rows = []
+    for u in cvU:
+        # CVs past the end joints take the weights of the end joint
+        u = min(max(u, jointU[0]), jointU[-1])
+        row = [max(0.0, 1 - abs(u - jointValue) / radius) for jointValue in jointU]
+        if falloff == "smooth":
+            row = [w * w * (3 - 2 * w) for w in row]
+        strongest = sorted(range(len(row)), key=lambda j: row[j], reverse=True)[:max(maxInfluences, 1)]
+        row = [w if j in strongest else 0.0 for j, w in enumerate(row)]
+        # A row with no weight left is kept as it is rather than divided by zero
+        total = sum(row)
+        rows.append([w / total for w in row] if total else row)
+    return rows
+
 
 class ribbonMaker:
+    # Stages are only timed during a build with timing on
+    timer = rigBuilder.stageTimer(enabled=False)
+    timings = None
+    
+    
     def run(self):
         ''' Runs the ribbon UI function when the script is called '''
         self.ribbonUI()
         
              
     def createRibbon(self, *args):
+        ''' Reads the settings from the UI and builds the ribbon '''
+        self.build(self.settingsFromUI())
+        
+        
+    def settingsFromUI(self):
+        ''' Fills in a ribbonSettings object from the ribbonToolUI widgets '''
+        settings = ribbonSettings(
+            name=cmds.textField("nameMenu", q=1, tx=1),
+            length=cmds.floatField("lengthMenu", q=1, v=1),
+            direction=cmds.optionMenu("directionMenu", q=1, v=1),
+            axis=cmds.optionMenu("axisMenu", q=1, v=1),
+            jointAxis=cmds.optionMenu("jointAxisMenu", q=1, v=1),
+            jointInvert=cmds.checkBox("snapInvertCheck", q=1, v=1),
+            insertIsoparm=cmds.checkBox("isoparmCheck", q=1, v=1),
+            hideJoints=cmds.checkBox("visCheck", q=1, v=1),
+            hideFollicles=cmds.checkBox("follicleCheck", q=1, v=1),
+            ctrlScale=cmds.floatField("scaleMenu", q=1, v=1),
+            ctrlColour=tuple(cmds.colorSliderGrp("colourMenu", q=1, rgb=1)),
+            altColour=tuple(cmds.colorSliderGrp("altColourMenu", q=1, rgb=1)),
+            altColourCheck=cmds.checkBox("altColourCheck", q=1, v=1),
+            jointSnap=cmds.checkBox("snapCheck", q=1, v=1),
+            endOrient=cmds.checkBox("endJointCheck", q=1, v=1))
+        
+        # The joint chain to snap to comes from the current selection
+        if settings.jointSnap:
+            selectionCheck = cmds.ls(sl=1, type="joint")
+            if not selectionCheck:
+                cmds.error("Please select the root joint of a 3 joint chain")
+            settings.snapRoot = selectionCheck[0]
+        return settings
+        
+        
+    def build(self, settings):
         ''' 
         Main function for creating the ribbon. 
-        Sets variables and runs other functions in order
+        Builds the ribbon described by a ribbonSettings object, without touching the UI
         '''
-        nurbsName = cmds.textField("nameMenu", q=1, tx=1)
-        nurbsLength = cmds.floatField("lengthMenu", q=1, v=1)
-        nurbsDirection = cmds.optionMenu("directionMenu", q=1, v=1)
-        nurbsAxis = cmds.optionMenu("axisMenu", q=1, v=1)
-        jointAxis = cmds.optionMenu("jointAxisMenu", q=1, v=1)
-        jointInvert = cmds.checkBox("snapInvertCheck", q=1, v=1)
-        insertIsoparm = cmds.checkBox("isoparmCheck", q=1, v=1)
-        ctrlScale = cmds.floatField("scaleMenu", q=1, v=1)
-        ctrlColour = cmds.colorSliderGrp("colourMenu", q=1, rgb=1)
-        jointSnap = cmds.checkBox("snapCheck", q=1, v=1)
-        endOrient = cmds.checkBox("endJointCheck", q=1, v=1)
+        # Each stage's time and cmds calls are recorded with timing on, the report is kept in self.timings
+        modules = (sys.modules[__name__], rigBuilder, skeletonIndex)
+        self.timer = rigBuilder.stageTimer(modules, settings.timing, settings.timingCommands)
+        try:
+            # Every setting and name is checked before the scene changes, with all the problems reported together
+            with self.timer.stage("preflight"):
+                report = self.preflight(settings)
+            if not report["valid"]:
+                cmds.error(rigBuilder.preflightMessage(report))
+            
+            # Every node the build makes is recorded, however it is made
+            recorder = rigBuilder.nodeRecorder()
+            recorder.start()
+            try:
+                ribbonGrp = self.execute(self.plan(settings))
+            finally:
+                # Reading back the recorded nodes is timed with the registry
+                self.timer.start("registry")
+                created = recorder.stop()
+                
+            # The registry lists the nodes by the builder's roles, so the ribbon can be found, torn down and rebuilt from it
+            builder = self.builder
+            roles = {role: [builder.name(x) for x in nodes] for role, nodes in builder.roles.items()}
+            rigBuilder.writeRegistry(settings.name, "ribbon", asdict(settings), created, roles)
+            return ribbonGrp
+        finally:
+            self.timings = self.timer.finish(settings.timingLog)
+            self.timer = ribbonMaker.timer
+        
+        
+    def plan(self, settings):
+        ''' 
+        Works out every node, attribute, connection and parent the builder stages make, as a plan of plain data.
+        Nothing in the scene is touched, so plans can be saved, compared between versions and timed on their own.
+        Plans are cached, identical settings are only planned once
+        '''
+        if isinstance(settings, dict):
+            settings = ribbonSettings(**settings)
+        # Timing settings don't change the plan, so they are left out of the key
+        key = repr(replace(settings, timing=False, timingCommands=False, timingLog=""))
+        if key in planCache:
+            # A cached plan is timed as its own stage, so the timings show the planning stages were skipped
+            with self.timer.stage("planCached"):
+                planCache[key] = planCache.pop(key)
+            return planCache[key]
+        
+        nurbsName = settings.name
+        planeAxis, jointOrient, endJointOrient = ribbonOrients(settings)
+        ribbonWidth = settings.length / settings.ctrlCount
+        
+        # The surface and deformers are made by cmds when the plan is executed, they are planned by the names they get
+        self.builder = rigBuilder.planBuilder()
+        builder = self.builder
+        cmdsNodes = {"ribbon": "_ribbon", "ribbonShape": "_ribbonShape", "sineDeformer": "_sine_def", "twistDeformer": "_twist_def",
+                     "sineHandle": "_sine_handle", "twistHandle": "_twist_handle"}
+        if settings.deformStack != "surface":
+            cmdsNodes.update({"twistSurface": "_twist", "sineSurface": "_sine", "blendShape": "_bShape"})
+        for role, suffix in cmdsNodes.items():
+            builder.roles[role] = [nurbsName + suffix]
+        
+        # Runs functions to set up the ribbon further
+        with self.planStage("groupDeformers"):
+            self.groupDeformers(nurbsName)
+        with self.planStage("addFollicles"):
+            ribbonJnt, ctrlTransforms = self.addFollicles(nurbsName, builder.node("ribbon"), jointOrient, endJointOrient, settings)
+        with self.planStage("addControllers"):
+            snapCtrl = self.addControllers(ribbonWidth, ribbonJnt, ctrlTransforms, nurbsName, settings)
+        with self.planStage("cleanHeirarchy"):
+            masterGrp = self.cleanHeirarchy(nurbsName)
+        with self.planStage("connectDeformers"):
+            self.connectDeformers(nurbsName, settings.direction)
+        with self.planStage("addAimPoints"):
+            self.addAimPoints()
+        
+        # The stages after the commit work from the planned controls, so they are kept with the operations
+        plan = {"settings": asdict(settings), "operations": builder.plan, "controls": self.controls,
+                "snapCtrl": snapCtrl, "ctrlU": self.ctrlU, "ribbonGrp": masterGrp}
+        planCache[key] = plan
+        # The least recently used plans are dropped once the cache is full
+        while len(planCache) > planCacheSize:
+            del planCache[next(iter(planCache))]
+        return plan
+        
+        
+    @contextmanager
+    def planStage(self, name):
+        ''' Times planning a stage and marks its operations in the plan, so applying them is timed under the same name '''
+        self.builder.stage(name)
+        with self.timer.stage("plan." + name):
+            yield
+        
+        
+    def execute(self, plan):
+        ''' 
+        Builds a ribbon from a plan. The surface and deformers are made with cmds, then every planned operation
+        is applied by the builder, all in one commit with the modifier backend. Skinning and constraints need
+        the committed nodes, so they come last. Returns the ribbon group
+        '''
+        settings = ribbonSettings(**plan["settings"])
+        nurbsName = settings.name
+        nurbsDirection = settings.direction
+        nurbsAxis = settings.axis
+        planeAxis = ribbonOrients(settings)[0]
         
         # Creates an empty list to be populated with the joint heirarchy to snap to
+        timer = self.timer
         jointHeirarchy = []
-        if jointSnap:
-            jointHeirarchy = self.snapHeirarchy()
-            
-        # Sets plane axis value for the nurbs surface based on the chosen facing axis
-        if nurbsAxis == "X":
-            planeAxis = [1, 0, 0]
-        elif nurbsAxis == "Y":
-            planeAxis = [0, 1 ,0]
-        else:
-            planeAxis = [0, 0, 1]
-                    
-        # Sets joint orient values to rotate the created joints to match the joing chain axis
-        if not jointInvert:
-            if jointAxis == "X":
-                jointOrient = [-90, 0, 0]
-            elif jointAxis == "Y":
-                jointOrient = [0, 180, -90]
-            else:
-                jointOrient = [0, 90, 0]
-        else:
-            if jointAxis == "X":
-                jointOrient = [-90, -180, 0]
-            elif jointAxis == "Y":
-                jointOrient = [0, 0, 90]
-            else:
-                jointOrient = [0, -90, 0]    
-        endJointOrient = [0, 0, 0]
-        if not endOrient:
-            endJointOrient = jointOrient
-        
-        # Checks for no ribbon name and already existing ribbon names                    
-        if nurbsName == "":
-            cmds.error("Please enter a ribbon name")
-        if cmds.objExists(nurbsName):
-            cmds.error("A ribbon with that name already exists, please select a unique name")
-    
-        jointCount = 3
-        nurbsDivisions = 8
+        if settings.jointSnap:
+            with timer.stage("snapHeirarchy"):
+                jointHeirarchy = self.snapHeirarchy(settings.snapRoot)
+        
+        # Surface spans default to two per control section, 8 for the standard 5 controls
+        nurbsDivisions = settings.spans or 2 * (settings.ctrlCount - 1)
         ribbonName = nurbsName + "_ribbon"
-        ribbonWidth = nurbsLength / 5
+        
+        # Every node the build creates is recorded by the builder, so no stage looks anything up by name
+        # With the modifier backend the planned operations are queued and only run when the builder commits
+        self.builder = rigBuilder.getBuilder(settings.backend)
+        builder = self.builder
         
         # Creates ribbon, rotates if needed and inserts isoparms
-        cmds.nurbsPlane(ax=planeAxis, d=3, lr=0.15, u=nurbsDivisions, v=1, w=nurbsLength, n=ribbonName)
+        timer.start("surface")
+        plane = cmds.nurbsPlane(ax=planeAxis, d=3, lr=0.15, u=nurbsDivisions, v=1, w=settings.length, n=ribbonName)
+        ribbon = builder.track(plane[0], "ribbon")
+        builder.track(plane[1], "history")
         if nurbsDirection == "Vertical":
-            cmds.setAttr(ribbonName+".rotate"+nurbsAxis, -90)
-            cmds.makeIdentity(ribbonName, apply=True, rotate=True)
-        if insertIsoparm:
-            cmds.insertKnotSurface((ribbonName+'.u[0.490]'), ch=True, nk=1, rpo=1)
-            cmds.insertKnotSurface((ribbonName+'.u[0.510]'), ch=True, nk=1, rpo=1)
+            cmds.setAttr(ribbon+".rotate"+nurbsAxis, -90)
+            cmds.makeIdentity(ribbon, apply=True, rotate=True)
+        if settings.insertIsoparm:
+            builder.track(cmds.insertKnotSurface((ribbon+'.u[0.490]'), ch=True, nk=1, rpo=1)[-1], "history")
+            builder.track(cmds.insertKnotSurface((ribbon+'.u[0.510]'), ch=True, nk=1, rpo=1)[-1], "history")
+        builder.track(cmds.listRelatives(ribbon, s=1, ni=1)[0], "ribbonShape")
         cmds.select(cl=1)    
         
-        # Runs functions to set up the ribbon further
-        self.addDeformers(nurbsName, ribbonName, nurbsDirection)
-        ribbonJnt, ribbonBindList = self.addFollicles(nurbsName, ribbonName, nurbsDivisions, nurbsDirection, jointOrient, endJointOrient)
-        snapCtrl = self.addControllers(ribbonWidth, ribbonJnt, ribbonBindList, nurbsName)
-        if jointSnap:
-            self.snapControl(snapCtrl, jointHeirarchy)
-        self.cleanHeirarchy(nurbsName)
-        self.connectDeformers(nurbsName, nurbsDirection)
-        self.aimAndPoint(nurbsName, jointAxis, jointInvert)
-        
-        
-    def snapHeirarchy(self):
-        ''' Creates list of joints to snap to based on user selection '''
-        selectionCheck = cmds.ls(sl=1, type="joint")
-        if not selectionCheck:
-            cmds.error("Please select the root joint of a 3 joint chain")
+        timer.start("addDeformers")
+        if settings.deformStack == "surface":
+            self.addSurfaceDeformers(nurbsName, ribbon, nurbsDirection)
         else:
-            snapRoot = cmds.ls(sl=1, type="joint")[0]
-        
-        # List is the children of the joint selection            
-        heirarchy = cmds.listRelatives(snapRoot, ad=1, type="joint")
-        # Ignore joint if the selection list constains a joint ending with "_roll_jnt"      
-        jointHeirarchy = (list(filter(lambda x: not x.endswith("_roll_jnt"), heirarchy)))
-        jointHeirarchy.append(snapRoot)
-        jointHeirarchy.reverse()
+            self.addDeformers(nurbsName, ribbon, nurbsDirection)
+        # Each planned stage is timed as it is applied, the modifier backend makes the nodes in the commit
+        rigBuilder.executePlan(builder, plan["operations"], timer)
+        timer.start("commit")
+        builder.commit()
+        
+        # Skinning and constraints need the nodes in the scene, so they come after the commit
+        self.controls = plan["controls"]
+        self.ctrlU = plan["ctrlU"]
+        timer.start("skinRibbon")
+        self.skinRibbon(settings)
+        if settings.jointSnap:
+            timer.start("snapControl")
+            self.snapControl(plan["snapCtrl"], jointHeirarchy, settings.snapRoot)
+        timer.start("aimAndPoint")
+        self.aimAndPoint(nurbsName, settings.jointAxis, settings.jointInvert)
+        timer.stop()
+        return plan["ribbonGrp"]
+        
+        
+    def buildBatch(self, settingsList):
+        ''' 
+        Builds several ribbons in one pass. The viewport refresh is suspended and the whole
+        batch is a single undo chunk. Returns a report with the build time of each ribbon
+        '''
+        # Specs can also be given as plain dictionaries of ribbonSettings values
+        settingsList = [ribbonSettings(**x) if isinstance(x, dict) else x for x in settingsList]
+        
+        # The whole batch is checked before anything is built, including names two ribbons would share
+        report = rigBuilder.mergeReports([self.preflight(x) for x in settingsList])
+        if not report["valid"]:
+            cmds.error(rigBuilder.preflightMessage(report))
+        
+        report = []
+        cmds.undoInfo(openChunk=True, chunkName="ribbonBatch")
+        cmds.refresh(suspend=True)
+        try:
+            for settings in settingsList:
+                start = time.perf_counter()
+                ribbonGrp = self.build(settings)
+                report.append({"name": settings.name, "group": ribbonGrp, "time": time.perf_counter() - start})
+        finally:
+            cmds.refresh(suspend=False)
+            cmds.undoInfo(closeChunk=True)
+        return report
+        
+        
+    def benchmarkBackends(self, settings, runs=3, backends=("cmds", "modifier")):
+        ''' 
+        Builds the same ribbon with each backend and undoes it again, counting every Maya command issued.
+        Returns the average build time, command count and builder operation count for each backend
+        '''
+        if isinstance(settings, dict):
+            settings = ribbonSettings(**settings)
+        report = {}
+        for backend in backends:
+            times = []
+            for run in range(runs):
+                runSettings = replace(settings, name=f"{settings.name}_{backend}{run}", backend=backend)
+                cmds.undoInfo(openChunk=True, chunkName="ribbonBenchmark")
+                try:
+                    with rigBuilder.countCommands(sys.modules[__name__], rigBuilder) as counter:
+                        start = time.perf_counter()
+                        self.build(runSettings)
+                        times.append(time.perf_counter() - start)
+                finally:
+                    cmds.undoInfo(closeChunk=True)
+                # Undoing the chunk leaves the scene as it was for the next run
+                cmds.undo()
+            report[backend] = {"time": sum(times) / runs, "commands": counter.total(), "calls": counter.calls, "operations": self.builder.operations}
+        return report
+        
+        
+    def benchmarkAttachments(self, settings, bindCounts=(9, 33, 129), runs=3, frames=50, attachments=("follicle", "uvPin")):
+        ''' 
+        Builds the same ribbon with follicles and with a uvPin at each bind joint count and undoes it again.
+        Each build is timed, along with evaluating every bind joint while the mid control moves over a number of frames.
+        Returns the average build and per frame evaluation time and node count for each attachment and count
+        '''
+        if isinstance(settings, dict):
+            settings = ribbonSettings(**settings)
+        report = []
+        for bindCount in bindCounts:
+            for attach in attachments:
+                buildTimes = []
+                evalTimes = []
+                for run in range(runs):
+                    runSettings = replace(settings, name=f"{settings.name}_{attach}{bindCount}_{run}", attach=attach, bindCount=bindCount)
+                    cmds.undoInfo(openChunk=True, chunkName="ribbonBenchmark")
+                    try:
+                        start = time.perf_counter()
+                        self.build(runSettings)
+                        buildTimes.append(time.perf_counter() - start)
+                        
+                        # Moving the mid control makes the whole surface and every attachment evaluate again
+                        builder = self.builder
+                        midCtrl = builder.name(self.controls[len(self.controls) // 2]["ctrl"])
+                        outputs = [builder.name(x)+".worldMatrix" for x in builder.nodes("bindJoints")]
+                        start = time.perf_counter()
+                        for frame in range(frames):
+                            cmds.setAttr(midCtrl+".translateZ", math.sin(frame * 0.2))
+                            cmds.dgeval(outputs)
+                        evalTimes.append((time.perf_counter() - start) / frames)
+                        nodeCount = len(builder.created)
+                    finally:
+                        cmds.undoInfo(closeChunk=True)
+                    # Undoing the chunk leaves the scene as it was for the next run
+                    cmds.undo()
+                report.append({"attach": attach, "bindCount": bindCount, "nodes": nodeCount,
+                               "buildTime": sum(buildTimes) / runs, "evalTime": sum(evalTimes) / runs})
+        return report
+        
+        
+    def preflight(self, settings):
+        ''' 
+        Checks a ribbon can be built before anything in the scene changes. Every name the build needs and
+        every name it will create is checked with one bulk query. Returns a report of every problem found
+        '''
+        if isinstance(settings, dict):
+            settings = ribbonSettings(**settings)
+        errors = []
+        if settings.name == "":
+            errors.append("Please enter a ribbon name")
+        if settings.ctrlCount < 3 or not settings.ctrlCount % 2:
+            errors.append("The control count must be an odd number, 3 or more")
+        if settings.bindCount < 2:
+            errors.append("The ribbon needs at least 2 bind joints")
+        if settings.maxInfluences < 1:
+            errors.append("The max influences must be 1 or more")
+        options = {"backend": ("cmds", "modifier"), "attach": ("follicle", "uvPin"), "deformStack": ("blendShape", "surface"),
+                   "skinWeights": ("auto", "linear", "smooth"), "ctrlShape": tuple(rigBuilder.controlShapes)}
+        for field, values in options.items():
+            if getattr(settings, field) not in values:
+                errors.append(f"Unknown {field}: {getattr(settings, field)}")
+        
+        required = []
+        if settings.jointSnap:
+            if settings.snapRoot:
+                required.append(settings.snapRoot)
+            else:
+                errors.append("Please select the root joint of a 3 joint chain")
+        created = ribbonNames(settings) if settings.name else []
+        report = rigBuilder.preflightReport(required, created, errors, {x: "joint" for x in required})
+        
+        # The snap chain only needs walking once the root is known to be a joint
+        if required and report["types"].get(settings.snapRoot) == "joint":
+            snapJoints = skeletonIndex.getIndex(settings.snapRoot).descendants(skipRoles=("roll",))
+            if len(snapJoints) < settings.ctrlCount:
+                report["errors"].append(f"Please select the root of a joint chain with at least {settings.ctrlCount} joints")
+                report["valid"] = False
+        return report
+        
+        
+    def registry(self, name):
+        ''' Returns the registry node of the named ribbon '''
+        registry = rigBuilder.findRegistry(name)
+        if not registry or rigBuilder.registrySettings(registry)[0] != "ribbon":
+            cmds.error(f"No ribbon named {name} was found")
+        return registry
+        
+        
+    def teardown(self, name):
+        ''' Deletes every node the named ribbon created, returning the settings it was built with '''
+        return ribbonSettings(**rigBuilder.teardownRig(self.registry(name))[1])
+        
+        
+    def rebuild(self, name, **changes):
+        ''' 
+        Tears down the named ribbon and builds it again from the settings in its registry, 
+        with any settings given changed. Returns the ribbon group
+        '''
+        # Changes are applied before the teardown, so a bad setting leaves the ribbon in place
+        registry = self.registry(name)
+        settings = replace(ribbonSettings(**rigBuilder.registrySettings(registry)[1]), **changes)
+        rigBuilder.teardownRig(registry)
+        return self.build(settings)
+        
+        
+    def snapHeirarchy(self, snapRoot):
+        ''' Creates list of joints to snap to, starting from the given root joint '''
+        if not snapRoot or not cmds.objExists(snapRoot):
+            cmds.error("Please select the root joint of a 3 joint chain")
+        
+        # List is the joint selection and its children, parents first, from the cached skeleton index
+        # Ignore joint if the selection list constains a roll joint
+        jointHeirarchy = skeletonIndex.getIndex(snapRoot).descendants(skipRoles=("roll",))
         cmds.select(cl=1)
         return jointHeirarchy                
 
 
     def addDeformers(self, name, ribbon, direction):
         ''' Duplicate ribbon to make sine and twist blend shapes '''
-        ribbonTwist = name+"_twist"
-        ribbonSine = name+"_sine"
-        twistDef = name+"_twist_def"
-        sineDef = name+"_sine_def"
-        twistHandle = name+"_twist_handle"
-        sineHandle = name+"_sine_handle"
-        bShape = name+"_bShape"
-        
-        cmds.duplicate(ribbon, n=ribbonTwist)
-        cmds.duplicate(ribbon, n=ribbonSine)
+        builder = self.builder
+        ribbonTwist = builder.track(cmds.duplicate(ribbon, n=name+"_twist")[0], "twistSurface")
+        ribbonSine = builder.track(cmds.duplicate(ribbon, n=name+"_sine")[0], "sineSurface")
         # Add sine and twist deformers, rotate if needed and create blend shape
         twist = cmds.nonLinear(ribbonTwist, type="twist")  
         sine = cmds.nonLinear(ribbonSine, type="sine") 
         if direction == "Horizontal":
             cmds.rotate(0, 0, 90, (sine[1]), (twist[1]), r=1, os=1)
-        cmds.rename(sine[0], sineDef)
-        cmds.rename(twist[0], twistDef)
-        cmds.rename(sine[1], sineHandle)
-        cmds.rename(twist[1], twistHandle)
-        cmds.blendShape(ribbonSine, ribbonTwist, ribbon, n=bShape, foc=1)      
+        builder.track(cmds.rename(sine[0], name+"_sine_def"), "sineDeformer")
+        builder.track(cmds.rename(twist[0], name+"_twist_def"), "twistDeformer")
+        sineHandle = builder.track(cmds.rename(sine[1], name+"_sine_handle"), "sineHandle")
+        twistHandle = builder.track(cmds.rename(twist[1], name+"_twist_handle"), "twistHandle")
+        builder.track(cmds.blendShape(ribbonSine, ribbonTwist, ribbon, n=name+"_bShape", foc=1)[0], "blendShape")
         cmds.setAttr((twistHandle+".visibility"), 0)
         cmds.setAttr((sineHandle+".visibility"), 0)
         cmds.setAttr(ribbonTwist+".visibility", 0)
         cmds.setAttr(ribbonSine+".visibility", 0)
+        cmds.select(cl=1)
         
-        # Group deformer handles and ribbons along with the main ribbon
-        ribbonGrp = cmds.group(n=f"{name}"+"_deform", em=1)
-        cmds.parent(twistHandle, sineHandle, ribbonSine, ribbonTwist, ribbon, ribbonGrp)     
+        
+    def addSurfaceDeformers(self, name, ribbon, direction):
+        ''' 
+        Puts the sine and twist deformers straight on the ribbon, with no duplicate surfaces or blend shape.
+        The blend attributes drive the deformer envelopes, so an effect at zero is skipped when the ribbon evaluates
+        '''
+        builder = self.builder
+        # Made before the skinCluster, so the skin deforms the result of the sine and twist
+        sine = cmds.nonLinear(ribbon, type="sine")
+        twist = cmds.nonLinear(ribbon, type="twist")
+        if direction == "Horizontal":
+            cmds.rotate(0, 0, 90, (sine[1]), (twist[1]), r=1, os=1)
+        sineDef = builder.track(cmds.rename(sine[0], name+"_sine_def"), "sineDeformer")
+        twistDef = builder.track(cmds.rename(twist[0], name+"_twist_def"), "twistDeformer")
+        sineHandle = builder.track(cmds.rename(sine[1], name+"_sine_handle"), "sineHandle")
+        twistHandle = builder.track(cmds.rename(twist[1], name+"_twist_handle"), "twistHandle")
+        # Both effects start switched off, as the blend shape weights did
+        cmds.setAttr(sineDef+".envelope", 0)
+        cmds.setAttr(twistDef+".envelope", 0)
+        cmds.setAttr((twistHandle+".visibility"), 0)
+        cmds.setAttr((sineHandle+".visibility"), 0)
         cmds.select(cl=1)
+        
+        
+    def groupDeformers(self, name):
+        ''' Group deformer handles and ribbons along with the main ribbon '''
+        builder = self.builder
+        deformed = [builder.node(x) for x in ["twistHandle", "sineHandle", "sineSurface", "twistSurface"] if builder.nodes(x)]
+        ribbonGrp = builder.createNode("transform", name+"_deform", role="deformGrp")
+        builder.parent(deformed + [builder.node("ribbon")], ribbonGrp)
 
 
-    def addFollicles(self, name, ribbon, divisions, direction, jointOrient, endJointOrient):
-        ''' Creates follicles and joints for the ribbon '''
-        follicleCheck = cmds.checkBox("follicleCheck", q=1, v=1)
-        follicleName = name + "_follicle"   
-        
-        # Creates follicles and deletes unneccessary components
-        cmds.select (ribbon)
-        mm.eval(f'createHair {divisions+1} 1 10 0 0 1 0 5 0 1 2 1;')  
-        hairDelete = cmds.ls(f'hairSystem?', 'pfxHair?', 'nucleus?')
-        cmds.delete(hairDelete)
-        cmds.select("hairSystem?Follicles")
-        cmds.rename(follicleName+"s")
-        folliclesOldList = cmds.ls(f"{ribbon}"+"Follicle*", type="transform")
-
-        # Renames follicles, deletes curve node and sets follicle visibility
-        for i in range(len(folliclesOldList)):
-            if follicleCheck:
-                cmds.setAttr(folliclesOldList[i]+".visibility", 0)
-            folliclesNewName = follicleName+"_00"
-            cmds.select(folliclesOldList[i])
-            cmds.rename(folliclesNewName)
-            follicleCurves= cmds.ls("curve*")
-            if follicleCurves:
-                cmds.delete(follicleCurves)
-        cmds.select(cl=1)
+    def addFollicles(self, name, ribbon, jointOrient, endJointOrient, settings):
+        ''' Creates follicles and bind joints for the ribbon and works out where the control joints go '''
+        builder = self.builder
+        bindCount = settings.bindCount
+        ctrlCount = settings.ctrlCount
         
-        visCheck = cmds.checkBox("visCheck", q=1, v=1)
-        follicleCount = cmds.ls(f"{name}_follicle_??")
-        ribbonBase = f"{name}_base"
-        ribbonUpper = f"{name}_upper"
-        ribbonMid = f"{name}_mid"
-        ribbonLower = f"{name}_lower"
-        ribbonEnd = f"{name}_end"
-        ribbonJnt = [ribbonBase, ribbonUpper, ribbonMid, ribbonLower, ribbonEnd]
-        ribbonJntList = [ribbonBase, 0, ribbonUpper, 0, ribbonMid, 0, ribbonLower, 0, ribbonEnd]
-        ribbonBindList = []
-        
-        # Loop 9 times to create a joint at each follicle point
-        for c, (value1, value2) in enumerate(zip(follicleCount, ribbonJntList)):
-            bindJoint = cmds.joint(n=f"{name}_bind_{c:02}", rad=0.25)            
-            if visCheck:
-                cmds.setAttr(bindJoint+".visibility", 0)
-            # If on an odd number make a duplicate joint, match transforms of follicle and add to list
-            if c % 2 == 0 :
-                cmds.duplicate(bindJoint, n=value2+"_jnt")
-                cmds.setAttr(value2+"_jnt.radius", 0.4)
-                cmds.matchTransform(value2+"_jnt", value1)
-                # Orient to world is selected from UI
-                if c == 0:
-                    cmds.rotate((endJointOrient[0]), (endJointOrient[1]), (endJointOrient[2]), value2+"_jnt", r=1, os=1, fo=1)
-                else:
-                    cmds.rotate((jointOrient[0]), (jointOrient[1]), (jointOrient[2]), value2+"_jnt", r=1, os=1, fo=1)
-                cmds.makeIdentity(value2+"_jnt", a=True, t=1, r=1, s=1, n=0, pn=1)
-                ribbonBindList.append(value2+"_jnt")
-            # Place bind joint under follicle
-            cmds.parent(bindJoint, value1)
-            cmds.matchTransform(bindJoint, value1)
-            # Orient to world is selected from UI
-            if c == 0:
-                cmds.rotate((endJointOrient[0]), (endJointOrient[1]), (endJointOrient[2]), bindJoint, r=1, os=1, fo=1)
-            else:
-                cmds.rotate((jointOrient[0]), (jointOrient[1]), (jointOrient[2]), bindJoint, r=1, os=1, fo=1)
-            cmds.makeIdentity(bindJoint, a=True, t=1, r=1, s=1, n=0, pn=1)
-            cmds.select(cl=1)    
-        cmds.select(cl=1)
-        ribbonBindList.append(ribbon)
-        return ribbonJnt, ribbonBindList                
+        # Bind joints sit at the centre of bindCount equal sections along U, as createHair placed them
+        # Control joints are spread evenly from the first bind joint to the last
+        bindU = [(i + 0.5) / bindCount for i in range(bindCount)]
+        ctrlU = [bindU[0] + (bindU[-1] - bindU[0]) * i / (ctrlCount - 1) for i in range(ctrlCount)]
+        self.ctrlU = ctrlU
+        # With a uvPin every bind joint sits in the one pin group, otherwise each has its own follicle
+        uvPin = None
+        if settings.attach == "uvPin":
+            uvPin = self.createPins(name, bindU)
+            jointParents = [builder.node("attachGrp")] * bindCount
+        else:
+            jointParents = self.createFollicles(name, ribbon, bindU, settings.hideFollicles)
+        bindOrients, ctrlTransforms = jointTransforms(settings, bindCount, ctrlU, jointOrient, endJointOrient)
+        
+        # Bind joints are made straight under their follicle, with the orient offset as their joint orient
+        # Pinned joints take the pin's output matrix as their offsetParentMatrix instead
+        for c, (jointParent, orient) in enumerate(zip(jointParents, bindOrients)):
+            bindJoint = builder.createNode("joint", f"{name}_bind_{c:02}", parent=jointParent, role="bindJoints")
+            builder.setAttr(bindJoint, "radius", 0.25)
+            builder.setAttr(bindJoint, "jointOrient", *orient)
+            if uvPin:
+                builder.connectAttr(uvPin, f"outputMatrix[{c}]", bindJoint, "offsetParentMatrix")
+            if settings.hideJoints:
+                builder.setAttr(bindJoint, "visibility", 0)
+        return controlNames(name, ctrlCount), ctrlTransforms
 
 
-    def addControllers(self, width, jointList, ribbonBindList, name):
+    def createFollicles(self, name, ribbon, uValues, hide):
+        ''' 
+        Creates a follicle for each U value and wires it straight to the ribbon surface.
+        Only the follicle nodes are made, so there is no hairSystem or nucleus to build and delete
+        '''
+        builder = self.builder
+        ribbonShape = builder.node("ribbonShape")
+        follicleGrp = builder.createNode("transform", name+"_follicles", role="attachGrp")
+        follicleList = []
+        
+        for c, value in enumerate(uValues):
+            follicleName = f"{name}_follicle_{c:02}"
+            follicle = builder.createNode("transform", follicleName, parent=follicleGrp, role="follicles")
+            follicleShape = builder.createNode("follicle", follicleName+"Shape", parent=follicle, role="follicleShapes")
+            # The follicle outputs world space values so the transform must not inherit its parents
+            builder.setAttr(follicle, "inheritsTransform", 0)
+            builder.connectAttr(ribbonShape, "local", follicleShape, "inputSurface")
+            builder.connectAttr(ribbonShape, "worldMatrix[0]", follicleShape, "inputWorldMatrix")
+            builder.connectAttr(follicleShape, "outTranslate", follicle, "translate")
+            builder.connectAttr(follicleShape, "outRotate", follicle, "rotate")
+            builder.setAttr(follicleShape, "parameterU", value)
+            builder.setAttr(follicleShape, "parameterV", 0.5)
+            if hide:
+                builder.setAttr(follicle, "visibility", 0)
+            follicleList.append(follicle)
+        return follicleList
+        
+        
+    def createPins(self, name, uValues):
+        ''' 
+        Creates one uvPin node with an output matrix for each U value, in place of a follicle per joint.
+        The outputs are world space, so the group the pinned joints go in does not inherit its parents
+        '''
+        builder = self.builder
+        ribbonShape = builder.node("ribbonShape")
+        pinGrp = builder.createNode("transform", name+"_pins", role="attachGrp")
+        builder.setAttr(pinGrp, "inheritsTransform", 0)
+        uvPin = builder.createNode("uvPin", name+"_uvPin", role="uvPin")
+        builder.connectAttr(ribbonShape, "worldSpace[0]", uvPin, "deformedGeometry")
+        # Tangent along U (X) and normal out of the surface (Z) give the same frame as a follicle
+        builder.setAttr(uvPin, "tangentAxis", 0)
+        builder.setAttr(uvPin, "normalAxis", 2)
+        # Parameters from 0 to 1 along the surface, as follicles use
+        builder.setAttr(uvPin, "normalizedIsoParms", 1)
+        for c, value in enumerate(uValues):
+            builder.setAttr(uvPin, f"coordinate[{c}].coordinateU", value)
+            builder.setAttr(uvPin, f"coordinate[{c}].coordinateV", 0.5)
+        return uvPin
+        
+        
+    def addControllers(self, width, jointList, ctrlTransforms, name, settings):
         ''' Creates controllers and control joints so the ribbon can be deformed '''
-        jointAxis = cmds.optionMenu("jointAxisMenu", q=1, v=1)        
-        ctrlScale = cmds.floatField("scaleMenu", q=1, v=1)
-        mainCtrlColour = cmds.colorSliderGrp("colourMenu", q=1, rgb=1)
-        altCtrlColour = cmds.colorSliderGrp("altColourMenu", q=1, rgb=1)
-        altColourCheck = cmds.checkBox("altColourCheck", q=1, v=1)
-        ctrlList = []
+        builder = self.builder
+        jointAxis = settings.jointAxis
+        ctrlScale = settings.ctrlScale
+        mainCtrlColour = settings.ctrlColour
+        altCtrlColour = settings.altColour
+        altColourCheck = settings.altColourCheck
         snapCtrl = []
+        self.controls = []
         
-        # Sets normal axis direction for circle creation
+        # Sets normal axis direction for control shape creation
         if jointAxis == "X":
             normal = (1, 0, 0)
         elif jointAxis == "Y":
@@ -230,118 +764,158 @@ class ribbonMaker:
         
         mainScale = ((width/1.4)*ctrlScale)
         smallScale = ((width/1.7)*ctrlScale)     
+        # Both shapes come from the shape cache, along with the colours the controls alternate between
+        mainShape = rigBuilder.controlShape(settings.ctrlShape, normal, mainScale)
+        smallShape = rigBuilder.controlShape(settings.ctrlShape, normal, smallScale)
+        altColour = altCtrlColour if altColourCheck else mainCtrlColour
         
-        # Loop with a range of 5 to create a controller at every other ribbon joint
-        for c, value in enumerate(jointList):
-            # If on an even loop (upper / lower joints) make circle with certain radius, and group
-            if c % 2:
-                controller = cmds.circle(n=value+"_ctrl", nr=normal, r=smallScale)
-            else:
-                controller = cmds.circle(n=value+"_ctrl", nr=normal, r=mainScale)
-            ctrlGrp = cmds.group(controller, n=value+"_ctrl_grp")
+        # Controller heirarchies are built top down, with each offset placed from the precomputed control joint transform
+        offsetGrpMain = builder.createNode("transform", name+"_offset_grp", role="offsetGrp")
+        for c, (value, (position, rotation)) in enumerate(zip(jointList, ctrlTransforms)):
+            offsetGrp = builder.createNode("transform", value+"_offset", parent=offsetGrpMain, role="offsets")
+            builder.setAttr(offsetGrp, "translate", *position)
+            builder.setAttr(offsetGrp, "rotate", *rotation)
+            parentGrp = builder.createNode("transform", value+"_grp", parent=offsetGrp, role="parentGrps")
             # Place in aditional buffer group if upper or lower joint
+            aimGrp = None
             if c % 2:
-                aimGrp = cmds.group(ctrlGrp, n=value+"_aim")
-                parentGrp = cmds.group(aimGrp, n=value+"_grp")
-            else:
-                parentGrp = cmds.group(ctrlGrp, n=value+"_grp")
-            offsetGrp = cmds.group(parentGrp, n=value+"_offset")
-            # Place offset in same place as ribbon joint and parent the control joint
-            cmds.matchTransform(offsetGrp, value+"_jnt")
-            cmds.parent(value+"_jnt", controller[0])
+                aimGrp = builder.createNode("transform", value+"_aim", parent=parentGrp, role="aimGrps")
+            ctrlGrp = builder.createNode("transform", value+"_ctrl_grp", parent=aimGrp or parentGrp, role="ctrlGrps")
+            # The curve data is set straight on the shape, with no history node
+            # If on an even loop (upper / lower joints) use the smaller shape
+            ctrl = builder.createNode("transform", value+"_ctrl", parent=ctrlGrp, role="ctrls")
+            ctrlShape = builder.createNode("nurbsCurve", value+"_ctrlShape", parent=ctrl, role="ctrlShapes")
+            builder.setCurve(ctrlShape, *(smallShape if c % 2 else mainShape))
+            # The control joint sits at the controller with no local transform
+            ctrlJoint = builder.createNode("joint", value+"_jnt", parent=ctrl, role="ctrlJoints")
+            builder.setAttr(ctrlJoint, "radius", 0.4)
+            if settings.hideJoints:
+                builder.setAttr(ctrlJoint, "visibility", 0)
             # Set controller colour
-            cmds.setAttr(controller[0]+"Shape.overrideEnabled", 1)
-            cmds.setAttr(controller[0]+"Shape.overrideRGBColors", 1)
-            if c % 2 and altColourCheck:
-                cmds.setAttr(controller[0]+"Shape.overrideColorRGB", type="float3", *altCtrlColour)
-            else:
-                cmds.setAttr(controller[0]+"Shape.overrideColorRGB", type="float3", *mainCtrlColour)
-            snapCtrl.append(value+"_offset")
-            ctrlList.append(offsetGrp)
+            builder.setAttr(ctrlShape, "overrideEnabled", 1)
+            builder.setAttr(ctrlShape, "overrideRGBColors", 1)
+            builder.setAttr(ctrlShape, "overrideColorRGB", type="float3", *(altColour if c % 2 else mainCtrlColour))
+            snapCtrl.append(offsetGrp)
+            self.controls.append({"name": value, "ctrl": ctrl, "aim": aimGrp, "grp": parentGrp, "offset": offsetGrp, "joint": ctrlJoint})
+        return snapCtrl
+        
+        
+    def skinRibbon(self, settings):
+        ''' 
+        Skin ribbon to the control joints. With skinWeights set to "linear" or "smooth" the weights are worked out
+        from each CV's U parameter and set in one go, rather than left to Maya's binding
+        '''
+        builder = self.builder
+        ctrlJoints = [builder.name(x) for x in builder.nodes("ctrlJoints")]
+        if settings.skinWeights == "auto":
+            skin = cmds.skinCluster(ctrlJoints, builder.node("ribbon"), mi=2, tsb=True)
+            builder.track(skin[0], "skinCluster")
             cmds.select(cl=1)
+            return
         
-        # Group control offset groups and skin ribbon to bind joints
-        ctrlGrp = cmds.group(n=f"{name}"+"_offset_grp", em=1)
-        cmds.parent(ctrlList, ctrlGrp)
-        cmds.select(ribbonBindList)
-        cmds.skinCluster(mi=2, tsb=True)
+        # Closest distance is the cheapest bind method, its weights are all replaced straight after
+        skin = cmds.skinCluster(ctrlJoints, builder.node("ribbon"), mi=settings.maxInfluences, tsb=True, bm=0)
+        builder.track(skin[0], "skinCluster")
+        ribbonShape = builder.name(builder.node("ribbonShape"))
+        uCount, vCount, cvU = surfaceCVParameters(ribbonShape)
+        rows = skinWeights(cvU, self.ctrlU, settings.skinWeights, settings.maxInfluences)
+        # Every CV in a column shares the weights of its U parameter
+        cvs = [(u, v) for u in range(uCount) for v in range(vCount)]
+        weights = [w for u, v in cvs for w in rows[u]]
+        rigBuilder.setSkinWeights(skin[0], ribbonShape, cvs, weights, len(ctrlJoints))
         cmds.select(cl=1)
-        return snapCtrl
         
         
-    def snapControl(self, snapCtrl, snapJoints):
+    def snapControl(self, snapCtrl, snapJoints, snapRoot):
         ''' Snaps controller offset groups to joint chain and parents them '''
+        if len(snapJoints) < len(snapCtrl):
+            cmds.error(f"Please select the root of a joint chain with at least {len(snapCtrl)} joints")
+        # Each offset takes the position and rotation of its joint, from the world matrices cached on the skeleton index
+        matrices = skeletonIndex.getIndex(snapRoot).worldMatrices()
         for c, value in enumerate(snapCtrl):
-            cmds.matchTransform((snapCtrl[c]), (snapJoints[c]), pos=1, rot=1)
-            cmds.parentConstraint((snapJoints[c]), (snapCtrl[c]), mo=0)    
+            offsetGrp = self.builder.name(value)
+            matrix = matrices[snapJoints[c]]
+            cmds.xform(offsetGrp, ws=1, t=matrix[12:15], ro=matrixToEuler(matrixRotation(matrix)))
+            self.builder.track(cmds.parentConstraint((snapJoints[c]), offsetGrp, mo=0)[0], "constraints")
         cmds.select(cl=1)
         
 
     def cleanHeirarchy(self, name):  
         ''' Organises and cleans up the heirarchy '''
-        cmds.parent(f"{name}"+"_follicles", f"{name}"+"_deform")
-        masterGrp = cmds.group(n=f"{name}"+"_ribbon_grp", em=1)
-        cmds.parent(f"{name}"+"_deform", f"{name}"+"_offset_grp", masterGrp)
-        cmds.select(cl=1)
+        builder = self.builder
+        builder.parent(builder.node("attachGrp"), builder.node("deformGrp"))
+        masterGrp = builder.createNode("transform", name+"_ribbon_grp", role="ribbonGrp")
+        builder.parent([builder.node("deformGrp"), builder.node("offsetGrp")], masterGrp)
+        return masterGrp
             
         
     def connectDeformers(self, name, direction):   
         ''' Connect attributes to control twist and sine blend shapes '''
-        baseCtrl = f"{name}"+"_base_ctrl"
-        sineEnumAttr = f".{name}"+"SineDeform"
-        twistEnumAttr = f".{name}"+"TwistDeform"
-        ribbonTwist = name+"_twist"
-        ribbonSine = name+"_sine"
-        sineHandle = name+"_sine_handle"
-        twistHandle = name+"_twist_handle"
-        upCtrl = name+"_upper_ctrl"
-        lowCtrl = name+"_lower_ctrl"
+        builder = self.builder
+        baseCtrl = self.controls[0]["ctrl"]
+        sineDef = builder.node("sineDeformer")
+        twistDef = builder.node("twistDeformer")
+        sineHandle = builder.node("sineHandle")
+        twistHandle = builder.node("twistHandle")
         
         # Asign correct axis to be connected depending on ribbon direction
         if direction == "Horizontal":
-            transAxis = ".translateX"
+            transAxis = "translateX"
         else:
-            transAxis = ".translateY"
+            transAxis = "translateY"
         
         # Add attributes to the base controller
-        cmds.select(baseCtrl)
-        cmds.addAttr(ln=f"{name}"+"SineDeform", at="enum", en="---------------", k=1)
-        cmds.setAttr(baseCtrl+sineEnumAttr, l=1)
-        cmds.addAttr(ln="SineBlend", at="float", min=0, max=1, k=1)
-        cmds.addAttr(ln="SineAmplitude", at="float", dv=0.3, k=1)
-        cmds.addAttr(ln="SineWavelength", at="float", dv=2.0, k=1)
-        cmds.addAttr(ln="SineOrientation", at="float", k=1)
-        cmds.addAttr(ln="SineAnimate", at="float", k=1)
-        cmds.addAttr(ln="SineOffset", at="float", k=1)
-        cmds.addAttr(ln="SineDropoff", at="float", min=0, max=1, dv=1.0, k=1)
-        cmds.addAttr(ln=f"{name}"+"TwistDeform", at="enum", en="---------------", k=1)
-        cmds.setAttr(baseCtrl+twistEnumAttr, l=1)
-        cmds.addAttr(ln="TwistBlend", at="float", min=0, max=1, k=1)
-        cmds.addAttr(ln="TwistAnimate", at="float", k=1)
-        cmds.addAttr(ln="TwistOffset", at="float", k=1)
-        cmds.addAttr(ln=f"{name}"+"UpperLowerCtrl", at="enum", en="---------------", k=1)
-        cmds.addAttr(ln="ToggleVisibility", at="float", min=0, max=1, dv=1.0, k=1)      
+        builder.addAttr(baseCtrl, f"{name}SineDeform", "enum", enumNames="---------------")
+        builder.lockAttr(baseCtrl, f"{name}SineDeform")
+        builder.addAttr(baseCtrl, "SineBlend", "float", minValue=0, maxValue=1)
+        builder.addAttr(baseCtrl, "SineAmplitude", "float", default=0.3)
+        builder.addAttr(baseCtrl, "SineWavelength", "float", default=2.0)
+        builder.addAttr(baseCtrl, "SineOrientation", "float")
+        builder.addAttr(baseCtrl, "SineAnimate", "float")
+        builder.addAttr(baseCtrl, "SineOffset", "float")
+        builder.addAttr(baseCtrl, "SineDropoff", "float", default=1.0, minValue=0, maxValue=1)
+        builder.addAttr(baseCtrl, f"{name}TwistDeform", "enum", enumNames="---------------")
+        builder.lockAttr(baseCtrl, f"{name}TwistDeform")
+        builder.addAttr(baseCtrl, "TwistBlend", "float", minValue=0, maxValue=1)
+        builder.addAttr(baseCtrl, "TwistAnimate", "float")
+        builder.addAttr(baseCtrl, "TwistOffset", "float")
+        builder.addAttr(baseCtrl, f"{name}UpperLowerCtrl", "enum", enumNames="---------------")
+        builder.addAttr(baseCtrl, "ToggleVisibility", "float", default=1.0, minValue=0, maxValue=1)
         # Connect attributes to the sine and twist handles and deformers
-        cmds.connectAttr(baseCtrl+".SineBlend", f"{name}"+"_bShape"+f".{name}"+"_sine")
-        cmds.connectAttr(baseCtrl+".TwistBlend", f"{name}"+"_bShape"+f".{name}"+"_twist")
-        cmds.connectAttr(baseCtrl+".SineAmplitude", f"{ribbonSine}"+"_def"+".amplitude")
-        cmds.connectAttr(baseCtrl+".SineWavelength", f"{ribbonSine}"+"_def"+".wavelength")
-        cmds.connectAttr(baseCtrl+".SineAnimate", f"{ribbonSine}"+"_def"+".offset")
-        cmds.connectAttr(baseCtrl+".SineOffset", sineHandle+transAxis)
-        cmds.connectAttr(baseCtrl+".SineDropoff", f"{ribbonSine}"+"_def"+".dropoff")
-        cmds.connectAttr(baseCtrl+".TwistAnimate", f"{ribbonTwist}"+"_def"+".startAngle")  
-        cmds.connectAttr(baseCtrl+".TwistOffset", twistHandle+transAxis)                                      
-        cmds.connectAttr(baseCtrl+".SineOrientation", sineHandle+".rotateY")
-        cmds.connectAttr(baseCtrl+".ToggleVisibility", upCtrl+".visibility")
-        cmds.connectAttr(baseCtrl+".ToggleVisibility", lowCtrl+".visibility")
-        cmds.select(cl=1)
+        # Blend shape weights are connected by index, sine was added as the first target and twist as the second
+        # Without a blend shape the blend attributes gate the deformer envelopes instead
+        if builder.nodes("blendShape"):
+            bShape = builder.node("blendShape")
+            builder.connectAttr(baseCtrl, "SineBlend", bShape, "weight[0]")
+            builder.connectAttr(baseCtrl, "TwistBlend", bShape, "weight[1]")
+        else:
+            builder.connectAttr(baseCtrl, "SineBlend", sineDef, "envelope")
+            builder.connectAttr(baseCtrl, "TwistBlend", twistDef, "envelope")
+        builder.connectAttr(baseCtrl, "SineAmplitude", sineDef, "amplitude")
+        builder.connectAttr(baseCtrl, "SineWavelength", sineDef, "wavelength")
+        builder.connectAttr(baseCtrl, "SineAnimate", sineDef, "offset")
+        builder.connectAttr(baseCtrl, "SineOffset", sineHandle, transAxis)
+        builder.connectAttr(baseCtrl, "SineDropoff", sineDef, "dropoff")
+        builder.connectAttr(baseCtrl, "TwistAnimate", twistDef, "startAngle")
+        builder.connectAttr(baseCtrl, "TwistOffset", twistHandle, transAxis)
+        builder.connectAttr(baseCtrl, "SineOrientation", sineHandle, "rotateY")
+        # Visibility toggle drives the upper and lower controllers
+        for control in self.controls[1::2]:
+            builder.connectAttr(baseCtrl, "ToggleVisibility", control["ctrl"], "visibility")
 
 
+    def addAimPoints(self):
+        ''' Creates the up object groups for the in-between controllers, under the previous control joint '''
+        builder = self.builder
+        for c in range(1, len(self.controls), 2):
+            control = self.controls[c]
+            prevJoint = self.controls[c-1]["joint"]
+            control["aimPoint"] = builder.createNode("transform", control["name"]+"_aimpoint", parent=prevJoint, role="aimPoints")
+            
+            
     def aimAndPoint(self, name, jointAxis, invert):     # Aim and point constraints
-        ''' Create aim and point constraints for controllers between base, mid and end '''
-        ribbonBase = f"{name}_base"
-        ribbonMid = f"{name}_mid"
-        ribbonEnd = f"{name}_end"
+        ''' Create aim and point constraints for the in-between controllers '''
+        builder = self.builder
         
         # Set variable values based on the main axis and sign of the joint chain and ribbon joints
         # Ensures constraints are oriented correclty and aren't flipped
@@ -372,19 +946,20 @@ class ribbonMaker:
                 lowerAimVect = (0, 0, 1)
                 controlUp = (1, 0, 0)  
                               
-        # Create and place upper and lower aimpoint groups
-        upAPGrp = cmds.group(n=f"{name}"+"_upper_aimpoint", em=1)
-        lowAPGrp = cmds.group(n=f"{name}"+"_lower_aimpoint", em=1)        
-        cmds.parent(upAPGrp, ribbonBase+"_jnt")
-        cmds.matchTransform(upAPGrp, ribbonBase+"_jnt")    
-        cmds.parent(lowAPGrp, ribbonMid+"_jnt")
-        cmds.matchTransform(lowAPGrp, ribbonMid+"_jnt") 
-        # Create point constraints
-        cmds.pointConstraint(ribbonBase+"_jnt", ribbonMid+"_jnt", f"{name}"+"_upper_grp", w=1)
-        cmds.pointConstraint(ribbonEnd+"_jnt", ribbonMid+"_jnt", f"{name}"+"_lower_grp", w=1)
-        # Create aim constraints       
-        cmds.aimConstraint(ribbonMid+"_jnt", f"{name}"+"_upper_aim", aim=upperAimVect, u=controlUp, wu=controlUp, wut="objectrotation", wuo=upAPGrp, w=1)
-        cmds.aimConstraint(ribbonMid+"_jnt", f"{name}"+"_lower_aim", aim=lowerAimVect, u=controlUp, wu=controlUp, wut="objectrotation", wuo=lowAPGrp, w=1)
+        # In-between controllers are point constrained between their neighbours
+        # Those before the middle aim down the ribbon, the rest aim back up it, with the aim point group as the up object
+        midIndex = (len(self.controls) - 1) // 2
+        for c in range(1, len(self.controls), 2):
+            control = self.controls[c]
+            prevJoint = builder.name(self.controls[c-1]["joint"])
+            nextJoint = builder.name(self.controls[c+1]["joint"])
+            if c < midIndex:
+                aimTarget, aimVect = nextJoint, upperAimVect
+            else:
+                aimTarget, aimVect = prevJoint, lowerAimVect
+            aimPointGrp = builder.name(control["aimPoint"])
+            builder.track(cmds.pointConstraint(prevJoint, nextJoint, builder.name(control["grp"]), w=1)[0], "constraints")
+            builder.track(cmds.aimConstraint(aimTarget, builder.name(control["aim"]), aim=aimVect, u=controlUp, wu=controlUp, wut="objectrotation", wuo=aimPointGrp, w=1)[0], "constraints")
         cmds.select(cl=1)
     
     
@@ -529,4 +1104,53 @@ class ribbonMaker:
                     ]        
         )    
         cmds.showWindow(window)
-        cmds.optionMenu('axisMenu', e=1, v='Z')
\ No newline at end of file
+        cmds.optionMenu('axisMenu', e=1, v='Z')
+
+def build(settings):
+    ''' Builds a ribbon from a ribbonSettings object without the UI, e.g. in batch under mayapy '''
+    return ribbonMaker().build(settings)
+
+
+def plan(settings):
+    ''' Plans a ribbon as plain data without touching the scene '''
+    return ribbonMaker().plan(settings)
+
+
+def execute(plan):
+    ''' Builds a ribbon from a plan and returns the ribbon group '''
+    return ribbonMaker().execute(plan)
+
+
+def preflight(settings):
+    ''' Checks a ribbon can be built and returns the report, without changing the scene '''
+    return ribbonMaker().preflight(settings)
+
+
+def buildBatch(settingsList):
+    ''' Builds a list of ribbons in one undo chunk and returns the per ribbon timing report '''
+    return ribbonMaker().buildBatch(settingsList)
+
+
+def nodes(name):
+    ''' Returns every node the named ribbon created, by role '''
+    return rigBuilder.registryNodes(ribbonMaker().registry(name))
+
+
+def teardown(name):
+    ''' Deletes every node the named ribbon created and returns the settings it was built with '''
+    return ribbonMaker().teardown(name)
+
+
+def rebuild(name, **changes):
+    ''' Builds the named ribbon again from its registry, with any settings given changed '''
+    return ribbonMaker().rebuild(name, **changes)
+
+
+def benchmarkBackends(settings, runs=3):
+    ''' Compares build times and command counts of the cmds and modifier backends for one ribbon '''
+    return ribbonMaker().benchmarkBackends(settings, runs)
+
+
+def benchmarkAttachments(settings, bindCounts=(9, 33, 129), runs=3):
+    ''' Compares build time, evaluation time and node count of follicle and uvPin ribbons '''
+    return ribbonMaker().benchmarkAttachments(settings, bindCounts, runs)
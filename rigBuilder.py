@@ -0,0 +1,783 @@
+''' Rig Builder - node creation shared by the rigging tools '''
+
+import json
+import os
+import time
+from contextlib import contextmanager
+
+import maya.cmds as cmds
+import maya.api.OpenMaya as om
+import maya.api.OpenMayaAnim as oma
+
+
+# Modifiers waiting to be committed by the rigBuilderCommit command
+pendingCommits = []
+
+# Cache of node types that live in the DAG, filled in as types are first used
+dagTypes = {}
+
+# Control shapes as degree, form and CVs of a unit curve facing Z, periodic curves repeat their first CVs
+controlShapes = {
+    "circle": (3, 2, [(0.783612, 0.783612, 0), (0, 1.108194, 0), (-0.783612, 0.783612, 0), (-1.108194, 0, 0),
+                      (-0.783612, -0.783612, 0), (0, -1.108194, 0), (0.783612, -0.783612, 0), (1.108194, 0, 0),
+                      (0.783612, 0.783612, 0), (0, 1.108194, 0), (-0.783612, 0.783612, 0)]),
+    "square": (1, 0, [(1, 1, 0), (-1, 1, 0), (-1, -1, 0), (1, -1, 0), (1, 1, 0)])}
+
+# Cache of control shape curves already worked out, by shape, normal and scale
+shapeCache = {}
+
+# Added to a rig's name to name its registry node
+registrySuffix = "_registry"
+
+# Nodes a rig lists under this role are used by other rigs too, so tearing the rig down keeps them
+sharedRole = "shared"
+
+
+class cmdsBuilder:
+    '''
+    Creates nodes straight away through maya.cmds and records every node it makes, grouped by role.
+    Tools work from the recorded nodes, so nothing has to be looked up again by name or wildcard
+    '''
+    def __init__(self):
+        self.created = []
+        self.roles = {}
+        self.operations = 0
+
+
+    def track(self, node, role=None):
+        ''' Records a node created by the tool and returns it '''
+        self.created.append(node)
+        if role:
+            self.roles.setdefault(role, []).append(node)
+        return node
+
+
+    def nodes(self, role):
+        ''' Returns every node recorded under a role, in creation order '''
+        return self.roles.get(role, [])
+
+
+    def node(self, role, index=0):
+        ''' Returns a single node recorded under a role '''
+        return self.roles[role][index]
+
+
+    def name(self, node):
+        ''' Returns the scene name of a recorded node '''
+        return node
+
+
+    def rename(self, old, new):
+        ''' Swaps a recorded node name for its new name after a rename or reparent '''
+        if old == new:
+            return
+        self.created = [new if x == old else x for x in self.created]
+        for role, nodes in self.roles.items():
+            self.roles[role] = [new if x == old else x for x in nodes]
+
+
+    def count(self):
+        ''' Counts one builder operation, each one is a Maya command for this builder '''
+        self.operations += 1
+
+
+    def createNode(self, nodeType, name, parent=None, role=None):
+        ''' Creates a node, optionally under a parent, without changing the selection '''
+        self.count()
+        if parent:
+            node = cmds.createNode(nodeType, n=name, p=parent, ss=1)
+        else:
+            node = cmds.createNode(nodeType, n=name, ss=1)
+        return self.track(node, role)
+
+
+    def setAttr(self, node, attr, *values, **kwargs):
+        self.count()
+        cmds.setAttr(f"{node}.{attr}", *values, **kwargs)
+
+
+    def lockAttr(self, node, attr):
+        self.count()
+        cmds.setAttr(f"{node}.{attr}", l=1)
+
+
+    def addAttr(self, node, longName, attrType, default=None, minValue=None, maxValue=None, enumNames=None, keyable=True):
+        ''' Adds a dynamic attribute, taking the same options as cmds.addAttr '''
+        self.count()
+        flags = {"ln": longName, "at": attrType, "k": keyable}
+        if default is not None:
+            flags["dv"] = default
+        if minValue is not None:
+            flags["min"] = minValue
+        if maxValue is not None:
+            flags["max"] = maxValue
+        if enumNames is not None:
+            flags["en"] = enumNames
+        cmds.addAttr(node, **flags)
+
+
+    def connectAttr(self, src, srcAttr, dst, dstAttr):
+        self.count()
+        cmds.connectAttr(f"{src}.{srcAttr}", f"{dst}.{dstAttr}", f=1)
+
+
+    def setCurve(self, node, degree, form, knots, points):
+        ''' Sets the curve data of a nurbsCurve shape directly, so the shape needs no history node '''
+        self.count()
+        spans = len(points) - degree
+        cmds.setAttr(f"{node}.cached", degree, spans, form, False, 3, knots, len(knots), len(points), *points, type="nurbsCurve")
+
+
+    def parent(self, nodes, parent, relative=False):
+        ''' Reparents nodes and keeps the recorded names up to date '''
+        self.count()
+        if isinstance(nodes, str):
+            nodes = [nodes]
+        newNames = cmds.parent(nodes, parent, r=relative)
+        for old, new in zip(nodes, newNames):
+            self.rename(old, new)
+        return newNames
+
+
+    def commit(self):
+        ''' Nothing is queued by this builder, every operation has already run '''
+        pass
+
+
+class modifierBuilder(cmdsBuilder):
+    '''
+    Queues node creation, reparenting, attribute values and connections on an OpenMaya 2 DAG modifier,
+    then applies them all with one doIt when commit is called. The commit runs through the
+    rigBuilderCommit command, so everything queued is a single undo step.
+    Queued nodes are handled as MObjects, nodes made by other commands can be passed in by name
+    '''
+    def __init__(self):
+        super().__init__()
+        self.modifier = om.MDagModifier()
+        self.locks = []
+        self.objects = {}
+        self.dynamicAttrs = {}
+
+
+    def object(self, node):
+        ''' Returns the MObject for a node given either as an MObject or by name '''
+        if isinstance(node, om.MObject):
+            return node
+        if node not in self.objects:
+            selection = om.MSelectionList()
+            selection.add(node)
+            self.objects[node] = selection.getDependNode(0)
+        return self.objects[node]
+
+
+    def name(self, node):
+        ''' Returns the scene name of a node, only valid for queued nodes once they are committed '''
+        if isinstance(node, str):
+            return node
+        if node.hasFn(om.MFn.kDagNode):
+            return om.MFnDagNode(node).partialPathName()
+        return om.MFnDependencyNode(node).name()
+
+
+    def plug(self, node, attr):
+        ''' Finds a plug from an attribute string such as "translate", "worldMatrix[0]" or "weight[1]" '''
+        obj = self.object(node)
+        key = (om.MObjectHandle(obj).hashCode(), attr)
+        if key in self.dynamicAttrs:
+            return om.MPlug(obj, self.dynamicAttrs[key])
+        fnNode = om.MFnDependencyNode(obj)
+        plug = None
+        for part in attr.split("."):
+            attrName, _, index = part.partition("[")
+            if plug is None:
+                plug = fnNode.findPlug(attrName, False)
+            else:
+                plug = plug.child(fnNode.attribute(attrName))
+            if index:
+                plug = plug.elementByLogicalIndex(int(index[:-1]))
+        return plug
+
+
+    def setPlug(self, plug, value):
+        ''' Queues a plug value, using UI units for angles and distances as cmds.setAttr does '''
+        if isinstance(value, (list, tuple)):
+            for c, childValue in enumerate(value):
+                self.setPlug(plug.child(c), childValue)
+            return
+        attr = plug.attribute()
+        if attr.hasFn(om.MFn.kUnitAttribute):
+            unitType = om.MFnUnitAttribute(attr).unitType()
+            if unitType == om.MFnUnitAttribute.kAngle:
+                self.modifier.newPlugValueMAngle(plug, om.MAngle(value, om.MAngle.uiUnit()))
+            elif unitType == om.MFnUnitAttribute.kDistance:
+                self.modifier.newPlugValueMDistance(plug, om.MDistance(value, om.MDistance.uiUnit()))
+            else:
+                self.modifier.newPlugValueDouble(plug, value)
+        elif attr.hasFn(om.MFn.kEnumAttribute):
+            self.modifier.newPlugValueInt(plug, int(value))
+        elif attr.hasFn(om.MFn.kNumericAttribute):
+            numericType = om.MFnNumericAttribute(attr).numericType()
+            if numericType == om.MFnNumericData.kBoolean:
+                self.modifier.newPlugValueBool(plug, bool(value))
+            elif numericType in (om.MFnNumericData.kByte, om.MFnNumericData.kChar, om.MFnNumericData.kShort, om.MFnNumericData.kInt):
+                self.modifier.newPlugValueInt(plug, int(value))
+            else:
+                self.modifier.newPlugValueDouble(plug, float(value))
+        elif isinstance(value, str):
+            self.modifier.newPlugValueString(plug, value)
+        else:
+            self.modifier.newPlugValueDouble(plug, float(value))
+
+
+    def createNode(self, nodeType, name, parent=None, role=None):
+        self.count()
+        if isDagType(nodeType):
+            parentObj = self.object(parent) if parent else om.MObject.kNullObj
+            obj = self.modifier.createNode(nodeType, parentObj)
+        else:
+            obj = om.MDGModifier.createNode(self.modifier, nodeType)
+        self.modifier.renameNode(obj, name)
+        return self.track(obj, role)
+
+
+    def setAttr(self, node, attr, *values, **kwargs):
+        self.count()
+        self.setPlug(self.plug(node, attr), values if len(values) > 1 else values[0])
+
+
+    def lockAttr(self, node, attr):
+        ''' Plugs are locked straight after the doIt, locking is not something a modifier can queue '''
+        self.count()
+        self.locks.append(self.plug(node, attr))
+
+
+    def addAttr(self, node, longName, attrType, default=None, minValue=None, maxValue=None, enumNames=None, keyable=True):
+        self.count()
+        if attrType == "enum":
+            fnAttr = om.MFnEnumAttribute()
+            attr = fnAttr.create(longName, longName, 0)
+            for c, field in enumerate(enumNames.split(":")):
+                fnAttr.addField(field, c)
+        else:
+            numericTypes = {"float": om.MFnNumericData.kFloat, "double": om.MFnNumericData.kDouble,
+                            "bool": om.MFnNumericData.kBoolean, "long": om.MFnNumericData.kInt}
+            fnAttr = om.MFnNumericAttribute()
+            attr = fnAttr.create(longName, longName, numericTypes[attrType], default or 0)
+            if minValue is not None:
+                fnAttr.setMin(minValue)
+            if maxValue is not None:
+                fnAttr.setMax(maxValue)
+        fnAttr.keyable = keyable
+        obj = self.object(node)
+        self.modifier.addAttribute(obj, attr)
+        # Keep the attribute so later operations in this modifier can use it before it exists
+        self.dynamicAttrs[(om.MObjectHandle(obj).hashCode(), longName)] = attr
+
+
+    def connectAttr(self, src, srcAttr, dst, dstAttr):
+        self.count()
+        dstPlug = self.plug(dst, dstAttr)
+        if dstPlug.isDestination:
+            self.modifier.disconnect(dstPlug.source(), dstPlug)
+        self.modifier.connect(self.plug(src, srcAttr), dstPlug)
+
+
+    def setCurve(self, node, degree, form, knots, points):
+        self.count()
+        data = om.MFnNurbsCurveData().create()
+        # The API counts forms from 1 where setAttr counts them from 0
+        om.MFnNurbsCurve().create([om.MPoint(point) for point in points], knots, degree, form + 1, False, False, data)
+        self.modifier.newPlugValue(self.plug(node, "cached"), data)
+
+
+    def parent(self, nodes, parent, relative=False):
+        '''
+        Queues reparenting. The modifier always keeps the local transform,
+        the tools only reparent under groups sitting at the origin where the two are the same
+        '''
+        self.count()
+        if not isinstance(nodes, (list, tuple)):
+            nodes = [nodes]
+        parentObj = self.object(parent)
+        for node in nodes:
+            self.modifier.reparentNode(self.object(node), parentObj)
+        return list(nodes)
+
+
+    def commit(self):
+        ''' Applies everything queued so far with a single undoable command '''
+        if not self.operations:
+            return
+        loadCommitPlugin()
+        pendingCommits.append(modifierCommit(self.modifier, self.locks))
+        cmds.rigBuilderCommit()
+        self.modifier = om.MDagModifier()
+        self.locks = []
+
+
+class planBuilder(cmdsBuilder):
+    '''
+    Records every operation as plain data instead of running it, so a build can be planned without touching the scene.
+    Nodes are referred to by the names they will be given. executePlan applies the operations with a real builder
+    '''
+    def __init__(self):
+        super().__init__()
+        self.plan = []
+
+
+    def record(self, *operation):
+        ''' Adds an operation to the plan as a list, so the plan can be saved as JSON '''
+        self.count()
+        self.plan.append(list(operation))
+
+
+    def stage(self, name):
+        ''' Marks where the operations of a build stage start, so executing the plan can be timed by stage '''
+        self.plan.append(["stage", name])
+
+
+    def createNode(self, nodeType, name, parent=None, role=None):
+        self.record("createNode", nodeType, name, parent, role)
+        return self.track(name, role)
+
+
+    def setAttr(self, node, attr, *values, **kwargs):
+        self.record("setAttr", node, attr, list(values), kwargs)
+
+
+    def lockAttr(self, node, attr):
+        self.record("lockAttr", node, attr)
+
+
+    def addAttr(self, node, longName, attrType, default=None, minValue=None, maxValue=None, enumNames=None, keyable=True):
+        self.record("addAttr", node, longName, attrType, default, minValue, maxValue, enumNames, keyable)
+
+
+    def connectAttr(self, src, srcAttr, dst, dstAttr):
+        self.record("connectAttr", src, srcAttr, dst, dstAttr)
+
+
+    def setCurve(self, node, degree, form, knots, points):
+        self.record("setCurve", node, degree, form, list(knots), [list(x) for x in points])
+
+
+    def parent(self, nodes, parent, relative=False):
+        if isinstance(nodes, str):
+            nodes = [nodes]
+        self.record("parent", list(nodes), parent, relative)
+        return list(nodes)
+
+
+class modifierCommit:
+    ''' A modifier along with the plugs to lock once it has run, as used by the rigBuilderCommit command '''
+    def __init__(self, modifier, locks):
+        self.modifier = modifier
+        self.locks = locks
+
+
+    def doIt(self):
+        self.modifier.doIt()
+        for plug in self.locks:
+            plug.isLocked = True
+
+
+    def undoIt(self):
+        for plug in self.locks:
+            plug.isLocked = False
+        self.modifier.undoIt()
+
+
+class weightsCommit:
+    ''' Skin weights for a set of surface CVs, set in one call by the rigBuilderCommit command '''
+    def __init__(self, skinCluster, shape, cvs, weights, influenceCount):
+        selection = om.MSelectionList()
+        selection.add(skinCluster)
+        selection.add(shape)
+        self.skinFn = oma.MFnSkinCluster(selection.getDependNode(0))
+        self.shape = selection.getDagPath(1)
+        componentFn = om.MFnDoubleIndexedComponent()
+        self.components = componentFn.create(om.MFn.kSurfaceCVComponent)
+        componentFn.addElements(cvs)
+        self.influences = om.MIntArray(list(range(influenceCount)))
+        self.weights = om.MDoubleArray(weights)
+        self.oldWeights = None
+
+
+    def doIt(self):
+        # The weights are normalised already, and the old ones are kept to put back on undo
+        self.oldWeights = self.skinFn.setWeights(self.shape, self.components, self.influences, self.weights, False, True)
+
+
+    def undoIt(self):
+        self.skinFn.setWeights(self.shape, self.components, self.influences, self.oldWeights, False)
+
+
+class commandCounter:
+    ''' Stands in for the maya.cmds module and counts and times every command that goes through it '''
+    def __init__(self, module):
+        self.module = module
+        self.calls = {}
+        self.time = 0.0
+
+
+    def __getattr__(self, commandName):
+        command = getattr(self.module, commandName)
+        def countedCommand(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return command(*args, **kwargs)
+            finally:
+                self.time += time.perf_counter() - start
+                self.calls[commandName] = self.calls.get(commandName, 0) + 1
+        return countedCommand
+
+
+    def total(self):
+        return sum(self.calls.values())
+
+
+def buildNetwork(builder, nodes, connections):
+    '''
+    Creates a node network described as data and returns the created nodes by name.
+    nodes is a list of (nodeType, name, {attribute: value}) and connections a list of
+    (source, sourceAttr, destination, destinationAttr). Names that are not in nodes refer to existing scene nodes
+    '''
+    created = {}
+    for nodeType, name, values in nodes:
+        node = created[name] = builder.createNode(nodeType, name)
+        for attr, value in values.items():
+            if isinstance(value, (list, tuple)):
+                builder.setAttr(node, attr, *value)
+            else:
+                builder.setAttr(node, attr, value)
+    for src, srcAttr, dst, dstAttr in connections:
+        builder.connectAttr(created.get(src, src), srcAttr, created.get(dst, dst), dstAttr)
+    return created
+
+
+def executePlan(builder, plan, timer=None):
+    ''' 
+    Applies the operations recorded by a planBuilder with another builder. Planned names are swapped for the
+    nodes the builder creates, names that were not created by the plan refer to existing scene nodes.
+    Each stage marked in the plan is timed as its own stage by the timer, if given one
+    '''
+    nodes = {}
+    for operation, *args in plan:
+        if operation == "stage":
+            if timer:
+                timer.start(args[0])
+        elif operation == "createNode":
+            nodeType, name, parent, role = args
+            nodes[name] = builder.createNode(nodeType, name, nodes.get(parent, parent), role)
+        elif operation == "setAttr":
+            node, attr, values, kwargs = args
+            builder.setAttr(nodes.get(node, node), attr, *values, **kwargs)
+        elif operation == "connectAttr":
+            src, srcAttr, dst, dstAttr = args
+            builder.connectAttr(nodes.get(src, src), srcAttr, nodes.get(dst, dst), dstAttr)
+        elif operation == "parent":
+            children, parent, relative = args
+            newNames = builder.parent([nodes.get(x, x) for x in children], nodes.get(parent, parent), relative)
+            # Reparenting can give cmds nodes a new path, later operations need to use it
+            for child, newName in zip(children, newNames):
+                nodes[child] = newName
+        else:
+            node, *values = args
+            getattr(builder, operation)(nodes.get(node, node), *values)
+    return nodes
+
+
+@contextmanager
+def countCommands(*modules):
+    ''' Routes the cmds module of each given tool module through one commandCounter while the block runs '''
+    originals = [module.cmds for module in modules]
+    counter = commandCounter(originals[0])
+    for module in modules:
+        module.cmds = counter
+    try:
+        yield counter
+    finally:
+        for module, original in zip(modules, originals):
+            module.cmds = original
+
+
+class stageTimer:
+    '''
+    Records the wall time and number of cmds calls of each stage of a build, optionally split by command.
+    While timing, the cmds of the given tool modules go through one commandCounter. A disabled timer does nothing,
+    so the stages of a build can always be marked without slowing it down
+    '''
+    def __init__(self, modules=(), enabled=True, commandTypes=False):
+        self.modules = modules
+        self.enabled = enabled
+        self.commandTypes = commandTypes
+        self.stages = []
+        self.current = None
+        self.counter = None
+        self.originals = []
+
+
+    def start(self, name):
+        ''' Ends the running stage, if there is one, and starts timing the next '''
+        if not self.enabled:
+            return
+        if self.counter is None:
+            self.originals = [module.cmds for module in self.modules]
+            self.counter = commandCounter(self.originals[0])
+            for module in self.modules:
+                module.cmds = self.counter
+        self.stop()
+        self.current = (name, time.perf_counter(), dict(self.counter.calls))
+
+
+    def stop(self):
+        ''' Ends the running stage '''
+        if not self.current:
+            return
+        name, start, before = self.current
+        duration = time.perf_counter() - start
+        # Calls made during the stage are the counts now less the counts when it started
+        calls = {command: count - before.get(command, 0) for command, count in self.counter.calls.items() if count > before.get(command, 0)}
+        stage = {"stage": name, "time": duration, "commands": sum(calls.values())}
+        if self.commandTypes:
+            stage["calls"] = calls
+        self.stages.append(stage)
+        self.current = None
+
+
+    @contextmanager
+    def stage(self, name):
+        ''' Times the block as one stage '''
+        self.start(name)
+        try:
+            yield
+        finally:
+            self.stop()
+
+
+    def finish(self, logPath=""):
+        ''' Ends the running stage, puts the tool modules' cmds back and returns the report, adding it to a JSON log if given one '''
+        self.stop()
+        if self.counter is not None:
+            for module, original in zip(self.modules, self.originals):
+                module.cmds = original
+            self.counter = None
+        report = self.report()
+        if logPath and self.enabled:
+            # One report per line, so a log can collect every build
+            with open(logPath, "a") as logFile:
+                logFile.write(json.dumps(report) + "\n")
+        return report
+
+
+    def report(self):
+        ''' Returns every stage timed so far, with the totals '''
+        return {"stages": list(self.stages), "time": sum(x["time"] for x in self.stages),
+                "commands": sum(x["commands"] for x in self.stages)}
+
+
+def controlShape(shape, normal=(0, 0, 1), scale=1.0):
+    ''' 
+    Returns the degree, form, knots and CVs of a control shape turned to face a normal axis and scaled.
+    Results are cached, so controls sharing a shape and size only work it out once
+    '''
+    key = (shape, tuple(normal), scale)
+    if key not in shapeCache:
+        if shape not in controlShapes:
+            cmds.error(f"Unknown control shape: {shape}")
+        degree, form, points = controlShapes[shape]
+        # Shapes face Z, facing X or Y swaps that axis in
+        if normal[0]:
+            points = [(z, y, -x) for x, y, z in points]
+        elif normal[1]:
+            points = [(x, z, -y) for x, y, z in points]
+        points = [(x * scale, y * scale, z * scale) for x, y, z in points]
+        # Periodic curves have knots running past both ends, open curves repeat their end knots
+        if form == 2:
+            knots = list(range(1 - degree, len(points)))
+        else:
+            spans = len(points) - degree
+            knots = [0] * (degree - 1) + list(range(spans + 1)) + [spans] * (degree - 1)
+        shapeCache[key] = (degree, form, knots, points)
+    return shapeCache[key]
+
+
+def checkNames(required=(), created=()):
+    ''' 
+    Checks a list of names that must already exist, nodes or node.attribute plugs, and a list of names
+    about to be created, all with one bulk query. Returns the missing names, the names already taken
+    and the type of each required name that was found
+    '''
+    names = list(required) + list(created)
+    # ls only returns the names that exist, each followed by its type, so one query answers every check
+    listed = cmds.ls(names, showType=1) if names else []
+    found = dict(zip(listed[::2], listed[1::2]))
+    missing = [x for x in required if x not in found]
+    clashes = [x for x in created if x in found]
+    return missing, clashes, {x: found[x] for x in required if x in found}
+
+
+def preflightReport(required, created, errors=(), types=None):
+    '''
+    Checks the names of a build and returns the full pre-flight report, valid only if nothing was found wrong.
+    types maps required nodes to the node type they have to be
+    '''
+    missing, clashes, found = checkNames(required, created)
+    errors = list(errors)
+    for name, nodeType in (types or {}).items():
+        if name in found and found[name] != nodeType:
+            errors.append(f"{name} is not a {nodeType}")
+    # A name the build makes twice clashes with itself
+    seen = set()
+    for name in created:
+        if name in seen and name not in clashes:
+            clashes.append(name)
+        seen.add(name)
+    return {"required": list(required), "created": list(created), "missing": missing, "clashes": clashes,
+            "types": found, "errors": errors, "valid": not (missing or clashes or errors)}
+
+
+def mergeReports(reports):
+    ''' Combines the pre-flight reports of a batch, adding any name that two builds in the batch would both create '''
+    merged = {"required": [], "created": [], "missing": [], "clashes": [], "types": {}, "errors": []}
+    for report in reports:
+        merged["errors"] += report["errors"]
+        merged["created"] += report["created"]
+        merged["types"].update(report["types"])
+        # Builds can share required nodes, which only need listing once
+        for key in ("required", "missing", "clashes"):
+            merged[key] += [x for x in report[key] if x not in merged[key]]
+    seen = set()
+    for name in merged["created"]:
+        if name in seen and name not in merged["clashes"]:
+            merged["clashes"].append(name)
+        seen.add(name)
+    merged["valid"] = not (merged["missing"] or merged["clashes"] or merged["errors"])
+    return merged
+
+
+def preflightMessage(report):
+    ''' Turns the problems in a pre-flight report into one message '''
+    lines = list(report["errors"])
+    if report["missing"]:
+        lines.append("Missing: " + ", ".join(report["missing"]))
+    if report["clashes"]:
+        lines.append("Already exists: " + ", ".join(report["clashes"]))
+    return "\n".join(lines)
+
+
+class nodeRecorder:
+    '''
+    Records every node made while it is running through a node added callback, so nodes made by cmds,
+    mel and the API are all caught. Nodes are kept by uuid, which stays the same through renames
+    '''
+    def __init__(self):
+        self.uuids = []
+        self.callbackId = None
+
+
+    def start(self):
+        ''' Starts recording new nodes '''
+        self.callbackId = om.MDGMessage.addNodeAddedCallback(self.nodeAdded, "dependNode")
+
+
+    def nodeAdded(self, node, clientData=None):
+        self.uuids.append(om.MFnDependencyNode(node).uuid().asString())
+
+
+    def stop(self):
+        ''' Stops recording and returns the names of the recorded nodes still in the scene '''
+        if self.callbackId is not None:
+            om.MMessage.removeCallback(self.callbackId)
+            self.callbackId = None
+        # Temporary nodes deleted during the build are left out
+        return cmds.ls(self.uuids) if self.uuids else []
+
+
+def writeRegistry(name, rigType, settings, created, roles=None):
+    '''
+    Makes the registry node of a rig, holding its type, the settings it was built with and every node it created
+    grouped by role. Created nodes given a role by the tool are listed under it, the rest under their node type,
+    so roles are best named apart from node types.
+    Nodes are kept by uuid, so the registry still finds them after a rename or a scene reload
+    '''
+    nodeRoles = {}
+    for role, nodes in (roles or {}).items():
+        for node in nodes:
+            nodeRoles.setdefault(node, role)
+    listed = cmds.ls(created, showType=1) if created else []
+    nodes = listed[::2]
+    uuids = cmds.ls(nodes, uuid=1) if nodes else []
+    grouped = {}
+    for node, nodeType, uuid in zip(nodes, listed[1::2], uuids):
+        grouped.setdefault(nodeRoles.get(node, nodeType), []).append(uuid)
+        
+    registry = cmds.createNode("network", n=name + registrySuffix, ss=1)
+    for attr, value in (("rigType", rigType), ("rigSettings", json.dumps(settings)), ("rigNodes", json.dumps(grouped))):
+        cmds.addAttr(registry, ln=attr, dt="string")
+        cmds.setAttr(f"{registry}.{attr}", value, type="string")
+    return registry
+
+
+def findRegistry(name):
+    ''' Returns the registry node of the named rig, or None if there is no such rig '''
+    found = cmds.ls(name + registrySuffix, type="network")
+    return found[0] if found else None
+
+
+def registrySettings(registry):
+    ''' Returns the rig type and the settings a rig was built with '''
+    return cmds.getAttr(registry + ".rigType"), json.loads(cmds.getAttr(registry + ".rigSettings"))
+
+
+def registryNodes(registry):
+    ''' Returns the current names of every node a rig created, by role, leaving out nodes deleted since '''
+    roles = json.loads(cmds.getAttr(registry + ".rigNodes"))
+    uuids = [x for role in roles.values() for x in role]
+    names = cmds.ls(uuids) if uuids else []
+    # Names and uuids are matched up again, as nodes that are gone leave no place in the list
+    current = dict(zip(cmds.ls(names, uuid=1), names)) if names else {}
+    return {role: [current[x] for x in roleUuids if x in current] for role, roleUuids in roles.items()}
+
+
+def teardownRig(registry):
+    '''
+    Deletes every node a rig created and its registry, in one delete. Shared nodes are kept.
+    Returns the rig type and settings, so the rig can be built again
+    '''
+    rigType, settings = registrySettings(registry)
+    nodes = [x for role, names in registryNodes(registry).items() if role != sharedRole for x in names]
+    cmds.delete(nodes + [registry])
+    return rigType, settings
+
+
+def isDagType(nodeType):
+    ''' Checks whether a node type lives in the DAG, the result is cached for each type '''
+    if nodeType not in dagTypes:
+        dagTypes[nodeType] = "dagNode" in (cmds.nodeType(nodeType, isTypeName=1, inherited=1) or [])
+    return dagTypes[nodeType]
+
+
+def loadCommitPlugin():
+    ''' Loads the plugin providing the rigBuilderCommit command, which sits next to this file '''
+    if not cmds.pluginInfo("rigBuilderCmd", q=1, loaded=1):
+        cmds.loadPlugin(os.path.join(os.path.dirname(os.path.abspath(__file__)), "rigBuilderCmd.py"), quiet=1)
+
+
+def setSkinWeights(skinCluster, shape, cvs, weights, influenceCount):
+    ''' 
+    Sets the weights of every listed CV with a single undoable command. Weights are a flat list
+    holding influenceCount values for each CV, in the order of the skinCluster's influences
+    '''
+    loadCommitPlugin()
+    pendingCommits.append(weightsCommit(skinCluster, shape, cvs, weights, influenceCount))
+    cmds.rigBuilderCommit()
+
+
+def getBuilder(backend):
+    ''' Returns a new builder for the named backend, "cmds" or "modifier" '''
+    if backend == "modifier":
+        return modifierBuilder()
+    if backend == "cmds":
+        return cmdsBuilder()
+    cmds.error(f"Unknown build backend: {backend}")
@@ -0,0 +1,44 @@
+''' Rig Builder Command - plugin that commits a rigBuilder modifier or weight change as a single undoable command '''
+
+import maya.api.OpenMaya as om
+
+
+def maya_useNewAPI():
+    ''' Tells Maya this plugin uses the OpenMaya 2 API '''
+    pass
+
+
+class rigBuilderCommit(om.MPxCommand):
+    ''' Runs the next job waiting in rigBuilder.pendingCommits and keeps it for undo and redo '''
+    commandName = "rigBuilderCommit"
+
+    def __init__(self):
+        om.MPxCommand.__init__(self)
+        self.commit = None
+
+
+    def doIt(self, args):
+        # Imported here so the plugin shares the module the tools already loaded
+        import rigBuilder
+        self.commit = rigBuilder.pendingCommits.pop(0)
+        self.commit.doIt()
+
+
+    def redoIt(self):
+        self.commit.doIt()
+
+
+    def undoIt(self):
+        self.commit.undoIt()
+
+
+    def isUndoable(self):
+        return True
+
+
+def initializePlugin(plugin):
+    om.MFnPlugin(plugin).registerCommand(rigBuilderCommit.commandName, rigBuilderCommit)
+
+
+def uninitializePlugin(plugin):
+    om.MFnPlugin(plugin).deregisterCommand(rigBuilderCommit.commandName)
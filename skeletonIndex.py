@@ -0,0 +1,188 @@
+''' Skeleton Index - cached joint hierarchies shared by the rigging tools '''
+
+import maya.cmds as cmds
+import maya.api.OpenMaya as om
+
+
+# Skeleton indexes by root joint, kept between tool runs until their skeleton changes
+indexes = {}
+
+# Ids of the scene callbacks that clear every index and the time callback that drops their world matrices,
+# added when the first index is made
+callbackIds = []
+
+# Ids of callbacks left by indexes that have been dropped, removed outside of the callbacks themselves
+staleCallbackIds = []
+
+# Name tokens that mark a joint as part of a rig system rather than a bind joint
+roleTokens = ("roll", "IK", "FK", "stretch", "follow", "twist")
+
+
+class skeletonIndex:
+    '''
+    Walks every joint under a root once and records its parent, children, depth, side and role.
+    The index watches the nodes under its own root, so only changes to this skeleton drop it.
+    World matrices are read for the whole skeleton in one pass the first time they are asked for,
+    and read again once a joint or anything above the root has been moved
+    '''
+    def __init__(self, root):
+        self.key = root
+        self.root = root
+        self.parents = {}
+        self.children = {}
+        self.depths = {}
+        self.sides = {}
+        self.roles = {}
+        self.matrices = None
+        self.callbackIds = []
+
+        # Every node under the root with its full path and type, parents always come before their children
+        listed = cmds.ls(root, dag=1, long=1, showType=1)
+        dagPaths = listed[::2]
+        self.paths = [path for path, nodeType in zip(dagPaths, listed[1::2]) if nodeType == "joint"]
+        if not self.paths:
+            cmds.error(f"{root} is not a joint")
+        pathJoints = {}
+        self.joints = []
+        for path in self.paths:
+            joint = path.rpartition("|")[2]
+            pathJoints[path] = joint
+            self.joints.append(joint)
+            # The parent joint is the closest joint above, there can be other transforms in between
+            parentPath = path.rpartition("|")[0]
+            while parentPath and parentPath not in pathJoints:
+                parentPath = parentPath.rpartition("|")[0]
+            parent = pathJoints.get(parentPath)
+            self.parents[joint] = parent
+            self.children[joint] = []
+            if parent:
+                self.children[parent].append(joint)
+            self.depths[joint] = self.depths[parent] + 1 if parent else 0
+            tokens = joint.split("_")
+            self.sides[joint] = "L" if "L" in tokens else "R" if "R" in tokens else "C"
+            self.roles[joint] = next((x for x in tokens if x in roleTokens), "bind")
+        self.root = self.joints[0]
+        self.watch(dagPaths)
+
+
+    def watch(self, dagPaths):
+        '''
+        Adds callbacks on every node under the root, so the index is dropped when one is reparented, renamed, removed or given a child.
+        Attribute changes on those nodes and on the nodes above the root only drop the world matrices
+        '''
+        # The nodes above the root, from the top down
+        parts = dagPaths[0].split("|")[1:-1]
+        ancestors = ["|" + "|".join(parts[:i + 1]) for i in range(len(parts))]
+        selection = om.MSelectionList()
+        for path in dagPaths + ancestors:
+            selection.add(path)
+        for i in range(len(dagPaths)):
+            self.callbackIds += [om.MDagMessage.addAllDagChangesDagPathCallback(selection.getDagPath(i), self.changed),
+                                 om.MNodeMessage.addNameChangedCallback(selection.getDependNode(i), self.changed)]
+        for i in range(len(dagPaths) + len(ancestors)):
+            self.callbackIds.append(om.MNodeMessage.addAttributeChangedCallback(selection.getDependNode(i), self.moved))
+
+
+    def changed(self, *args):
+        ''' Drops this index, called by the callbacks on its nodes '''
+        if indexes.get(self.key) is self:
+            dropIndex(self.key)
+
+
+    def moved(self, *args):
+        ''' Drops the world matrices, called when an attribute of a joint or a node above the root changes '''
+        self.matrices = None
+
+
+    def worldMatrices(self):
+        ''' Returns the world matrix of every joint as a flat list of 16 values, read in one pass through the API '''
+        if self.matrices is None:
+            selection = om.MSelectionList()
+            for path in self.paths:
+                selection.add(path)
+            self.matrices = {joint: list(selection.getDagPath(i).inclusiveMatrix())
+                             for i, joint in enumerate(self.joints)}
+        return self.matrices
+
+
+    def positions(self, joints):
+        ''' Returns the world position of each joint, from the cached world matrices '''
+        matrices = self.worldMatrices()
+        return [matrices[joint][12:15] for joint in joints]
+
+
+    def descendants(self, joint=None, skipRoles=()):
+        ''' Returns the joint and every joint under it, parents first, leaving out joints with a role in skipRoles '''
+        joint = joint or self.root
+        found = []
+        stack = [joint]
+        while stack:
+            current = stack.pop()
+            if self.roles[current] not in skipRoles:
+                found.append(current)
+            stack.extend(reversed(self.children[current]))
+        return found
+
+
+    def chain(self, joint, length, skipRoles=roleTokens):
+        ''' Returns a chain of joints, following the first child joint down from the given joint that has no role in skipRoles '''
+        chain = [joint.rpartition("|")[2]]
+        while len(chain) < length:
+            children = [x for x in self.children[chain[-1]] if self.roles[x] not in skipRoles]
+            if not children:
+                break
+            chain.append(children[0])
+        return chain
+
+
+
+def dropIndex(root):
+    ''' Forgets the index of one skeleton, its callbacks are removed the next time an index is asked for '''
+    index = indexes.pop(root, None)
+    if index:
+        staleCallbackIds.extend(index.callbackIds)
+
+
+def clearIndexes(*args):
+    ''' Forgets every index, called when a scene is opened or created '''
+    for root in list(indexes):
+        dropIndex(root)
+
+
+def dropMatrices(*args):
+    ''' Drops the world matrices of every index, called when the time changes as animated joints move without an attribute change '''
+    for index in indexes.values():
+        index.matrices = None
+
+
+def removeStaleCallbacks():
+    ''' Removes the callbacks of dropped indexes, Maya callbacks should not remove themselves while running '''
+    if staleCallbackIds:
+        om.MMessage.removeCallbacks(staleCallbackIds)
+        del staleCallbackIds[:]
+
+
+def addCallbacks():
+    ''' Adds the scene callbacks that clear every index when the whole scene is replaced, and drop the world matrices on a time change '''
+    callbackIds.extend([
+        om.MSceneMessage.addCallback(om.MSceneMessage.kAfterNew, clearIndexes),
+        om.MSceneMessage.addCallback(om.MSceneMessage.kAfterOpen, clearIndexes),
+        om.MDGMessage.addTimeChangeCallback(dropMatrices)])
+
+
+def removeCallbacks():
+    ''' Removes every callback and forgets every index '''
+    clearIndexes()
+    removeStaleCallbacks()
+    om.MMessage.removeCallbacks(callbackIds)
+    del callbackIds[:]
+
+
+def getIndex(root):
+    ''' Returns the index of the skeleton under a root joint, walking it only if it is not cached '''
+    removeStaleCallbacks()
+    if not callbackIds:
+        addCallbacks()
+    if root not in indexes:
+        indexes[root] = skeletonIndex(root)
+    return indexes[root]